@@ -1,64 +1,195 @@
-from dash import Dash, html, dcc, callback, Output, Input
+from dash import Dash, html, dcc, callback, clientside_callback, ClientsideFunction, no_update, Output, Input, State, Patch
+from dash.exceptions import PreventUpdate
+from flask import Response, jsonify, request
 import dash_bootstrap_components as dbc
 import plotly.express as px
-import geopandas as gpd
+import plotly.io as pio
 import pandas as pd
+import hmac
+import os
+import uuid
 from pathlib import Path
 
+from dashboard.data import DATASET_FOLDER, FACILITY_COLUMNS, WASTE_TYPE_COLUMNS, DataRegistry, to_columns
+from dashboard.figcache import create_figure_cache, memoize
+from dashboard.metrics import CallbackMetrics
+from dashboard.background import BackgroundBuilds, Superseded
+from dashboard.geometry import DETAIL_LEVELS, attributes_from_facts, detail_level_for_zoom, feature_collection, view_for_bounds
+from dashboard import export, httpcache
 
-dataset_folder = Path('datasets/')
+
+dataset_folder = DATASET_FOLDER
 waste_dataset_folder = Path('datasets/waste_data')
 new_waste_dataset_folder = Path('datasets/waste_data/new')
 geojson_dataset_folder = Path('datasets/geojson')
 assets_picture_folder = "/assets/garbage.png"
 
-# Import your data
-data_2015 = gpd.read_file(waste_dataset_folder / '2015.csv')
-data_2016 = gpd.read_file(waste_dataset_folder / '2016.csv')
-data_2017 = gpd.read_file(waste_dataset_folder / '2017.csv')
-data_2018 = gpd.read_file(waste_dataset_folder / '2018.csv')
-data_2019 = gpd.read_file(waste_dataset_folder / '2019.csv')
-data_2020 = gpd.read_file(waste_dataset_folder / '2020.csv')
-data_2021 = gpd.read_file(waste_dataset_folder / '2021.csv')
-data_2022 = gpd.read_file(waste_dataset_folder / '2022.csv')
-
 # TENTATIVE (Cleaned from Google Colab)
-new_data_2015 = gpd.read_file(new_waste_dataset_folder / '2015.csv')
-new_data_2016 = gpd.read_file(new_waste_dataset_folder / '2016.csv')
-new_data_2017 = gpd.read_file(new_waste_dataset_folder / '2017.csv')
-new_data_2018 = gpd.read_file(new_waste_dataset_folder / '2018.csv')
-new_data_2019 = gpd.read_file(new_waste_dataset_folder / '2019.csv')
-new_data_2020 = gpd.read_file(new_waste_dataset_folder / '2020.csv')
-new_data_2021 = gpd.read_file(new_waste_dataset_folder / '2021.csv')
-new_data_2022 = gpd.read_file(new_waste_dataset_folder / '2022.csv')
-
-datasets_by_year = {
-    2015: new_data_2015,
-    2016: new_data_2016,
-    2017: new_data_2017,
-    2018: new_data_2018,
-    2019: new_data_2019,
-    2020: new_data_2020,
-    2021: new_data_2021,
-    2022: new_data_2022,
-}
-
-slider_marks = {year: {'label': str(year)} for year in range(2015, 2023)}
+# Loaded lazily, one year at a time, through a binary cache (.cache/dataset)
+# that is only rebuilt when one of the source files changes. The rest is
+# loaded in the background once the server is up (dashboard.serve instead
+# loads everything before forking its workers).
+registry = DataRegistry(dataset_folder)
+if os.environ.get('DASHBOARD_BACKGROUND_WARMUP', '1') == '1':
+    registry.warm_in_background()
+
+# Callback outputs keyed on their inputs and the fingerprint of the files
+# they are built from (see the *_version functions), so a rebuilt or
+# reloaded dataset never serves stale figures
+figure_cache = create_figure_cache()
+
+def year_version(selected_year, selected_region):
+    return registry.years_fingerprint([selected_year])
+
+def series_version(selected_region):
+    return registry.years_fingerprint(registry.years)
+
+def map_version(selected_column, selected_year, detail_level, map_node):
+    # The figure carries the outline URL and the node order too
+    return registry.years_fingerprint([selected_year], geometry=True)
+
+# Per-callback latency (split into data, figure and serialize phases),
+# response sizes and cache hit ratios, served on /metrics. Set
+# DASHBOARD_SLOW_CALLBACK_MS to log slow callbacks with their inputs.
+metrics = CallbackMetrics(caches={'figure': figure_cache})
+
+# Yearly files added or replaced on disk are picked up while serving, every
+# DASHBOARD_RELOAD_INTERVAL seconds (0 turns polling off) or on POST
+# /admin/reload. The figures of the years that changed (and the line and
+# area charts, which span every year, and the maps when the outlines
+# changed) get a new version, so are rebuilt; the old ones are dropped.
+reload_interval = float(os.environ.get('DASHBOARD_RELOAD_INTERVAL', '30'))
+
+def invalidate_figures():
+    """Drop the cached figures whose version no longer matches the data."""
+    builders = {builder.__name__: builder
+                for builder in (update_metrics, line_figure, map_figure, area_figure, pie_figure)}
+    figure_cache.invalidate(lambda name, args, version: version != builders[name].version(*args))
+
+def reload_data():
+    changes = registry.refresh()
+    if changes is not None:
+        invalidate_figures()
+    return changes
+
+def watch_data():
+    """Start polling the dataset folder; dashboard.serve calls this in every worker."""
+    if reload_interval > 0:
+        registry.watch(reload_interval, lambda changes: invalidate_figures())
+
+if os.environ.get('DASHBOARD_BACKGROUND_WARMUP', '1') == '1':
+    watch_data()
+
+slider_marks = {year: {'label': str(year)} for year in registry.years}
 
 # --------------------------------------
 # Choropleth - Data
 # (Kindly download shp files from this link: https://drive.google.com/drive/folders/1jbTFtNb8MRWi8B9MSl6VXKAChHfKug8O?usp=sharing)
+# The polygons are identical across years, so they are stored once; each
+# year's map columns join to them on ADM1_PCODE. The outlines are serialized
+# once per level of detail and served from their own URL; the choropleth
+# figures only reference it, so each callback sends just the colour and hover
+# arrays
 
-data_years = range(2015, 2023)
-geojson_data = {}
-for year in data_years:
-    geojson_data[year] = gpd.read_file(geojson_dataset_folder / f'{year}_gdf.geojson', driver='GeoJSON')
+data_years = registry.years
 
 # --------------------------------------
 
 # Initializing your Dash application
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 
+# The outline URLs carry the outlines' fingerprint, so browsers caching them
+# for a day still fetch new outlines as soon as a reload changes them
+def region_geojson_url(level):
+    return app.get_relative_path(f'/geometry/{registry.geometry_fingerprint[:16]}/regions-{level}.geojson')
+
+def child_geojson_url(name, level):
+    """Outlines of a province's or region's children, for a drilled-down map."""
+    return app.get_relative_path(f'/geometry/{registry.geometry_fingerprint[:16]}/children/'
+                                 f'{registry.hierarchy.position(name)}-{level}.geojson')
+
+def geometry_response(version, body, etag):
+    response = Response(body, mimetype='application/geo+json')
+    response.set_etag(etag)
+    # A figure built before a reload may still ask for the old version; it
+    # gets the current outlines, but only for this once
+    current = version == registry.geometry_fingerprint[:16]
+    response.headers['Cache-Control'] = httpcache.GEOMETRY_CACHE if current else 'no-cache'
+    return response
+
+# Compressed, ETag-tagged responses; the outlines below are cached by browsers.
+# Flask runs after_request hooks last-registered first, so metrics, installed
+# before httpcache, records the size of the body actually sent
+metrics.install(app.server)
+httpcache.install(app.server)
+
+# Figures missing from the cache are built on a small pool instead of on
+# every request thread at once; a newer request from the same page for
+# another figure in the same graph supersedes an older one still waiting,
+# which then sends nothing, unless the older one carries the graph's full
+# figure
+builds = BackgroundBuilds()
+
+# The key-card, series, waste-type and treatment figures as CSV, JSON Lines
+# or Arrow on /export/{table}.{format}, filtered by ?year= and ?region=
+export.install(app.server, registry)
+
+def build_figure(page_id, builder, *args, supersedable=True):
+    """``builder(*args)`` from the figure cache, or built in the background."""
+    cached = builder.lookup(*args)
+    if cached is not None:
+        return cached
+    try:
+        return builds.run(page_id, builder.__name__, builder.key(*args),
+                          metrics.bind(builder.compute), *args, supersedable=supersedable)
+    except Superseded:
+        raise PreventUpdate
+
+@app.server.route('/geometry/<version>/regions-<int:level>.geojson')
+def serve_region_geojson(version, level):
+    if level >= len(DETAIL_LEVELS):
+        return Response(status=404)
+    return geometry_response(version, registry.geojson_levels[level],
+                             f'{registry.geometry_fingerprint[:16]}-{level}')
+
+# Only the selected node's children are sent, concatenated from features
+# encoded once per node, so municipal outlines load one province at a time
+@app.server.route('/geometry/<version>/children/<int:node>-<int:level>.geojson')
+def serve_child_geojson(version, node, level):
+    hierarchy = registry.hierarchy
+    if node >= len(hierarchy.names) or level >= len(DETAIL_LEVELS):
+        return Response(status=404)
+    name = hierarchy.names[node]
+    if hierarchy.level(name) + 1 not in registry.admin_levels or not hierarchy.children(name):
+        return Response(status=404)
+    features = registry.child_features(name)[f'feature_{level}']
+    return geometry_response(version, feature_collection(features),
+                             f'{registry.geometry_fingerprint[:16]}-{node}-{level}')
+
+# Reload now instead of at the next poll; with several workers only the one
+# answering reloads at once, the others on their next poll. With
+# DASHBOARD_ADMIN_TOKEN set the request needs "Authorization: Bearer <token>";
+# without it, only direct requests from this machine are accepted.
+admin_token = os.environ.get('DASHBOARD_ADMIN_TOKEN')
+
+def is_admin_request():
+    if admin_token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {admin_token}')
+    # Behind a proxy every request comes from localhost; X-Forwarded-For gives it away
+    return request.remote_addr in ('127.0.0.1', '::1') and 'X-Forwarded-For' not in request.headers
+
+@app.server.route('/admin/reload', methods=['POST'])
+def reload_dataset():
+    if not is_admin_request():
+        return Response(status=403)
+    changes = reload_data()
+    return jsonify(changes or {'years': [], 'geometry': False, 'hierarchy': False})
+
+# Answers without touching the data, so a fresh worker is healthy at once
+@app.server.route('/healthz')
+def healthz():
+    return Response('ok', mimetype='text/plain')
+
 # You can make variables for your components / sections
 navbar = dbc.NavbarSimple(
     # children=[
@@ -77,13 +208,74 @@ dropdown_options = [
     {'label': 'Total Disposal Facilities', 'value': 'Total Disposal Facilities'}
 ]
 
+# Pie Chart - Colors
+category_colors = {
+    'Wastes with Cyanide': '#E69F00',  # Orange
+    'Acid Wastes': '#56B4E9',  # Sky Blue
+    'Alkali Wastes': '#009E73',  # Bluish Green
+    'Wastes with Inorganic Chemicals': '#F0E442',  # Bright Yellow
+    'Reactive Chemical Wastes': '#0072B2',  # Blue
+    'Inks/Dyes/Pigments/Paint/Latex/Adhesives/Organic Sludge': '#D55E00',  # Vermilion
+    'Waste Organic Solvents': '#CC79A7',  # Reddish Purple
+    'Organic Wastes': '#999999',  # Grey
+    'Oil': '#000000',  # Black
+    'Containers': '#BBBBBB',  # Light Gray
+    'Stabilized Wastes': '#000075',  # Dark Blue
+    'Organic Chemicals': '#A9A9A9',  # Dark Gray
+    'Miscellaneous Wastes': '#FBFCF8',  # White
+}
+
 # Region - Dropdown
+# Starts at the country and its regions; with provinces or municipalities in
+# the dataset, picking a node lists its children to drill further
+
+region_options = registry.hierarchy.options(registry.hierarchy.root)
 
-region_options = [{'label': region, 'value': region} for region in new_data_2015['Region'].unique()]
+# Clientside mode: the key cards, line, area and pie charts are computed in the
+# browser (assets/clientside.js) from a copy of the fact table shipped once
+# with the layout; only the choropleth still calls back to the server
+clientside_mode = os.environ.get('DASHBOARD_CLIENTSIDE') == '1'
+
+def clientside_data():
+    return {
+        'table': to_columns(registry.facts),
+        'colors': category_colors,
+        'template': pio.templates[pio.templates.default].to_plotly_json(),
+    }
+
+def offloadable_callback(*dependencies):
+    """Register a server callback, or in clientside mode the browser function of the same name."""
+    def decorator(func):
+        if clientside_mode:
+            clientside_callback(ClientsideFunction('dashboard', func.__name__),
+                                *dependencies, State('clientside-data', 'data'))
+            return func
+        return callback(*dependencies)(func)
+    return decorator
+
+# Each graph has a '<graph>-shown' store, set along with every full figure
+# the browser applies: True, or the map node the map was drawn for. Until it
+# matches, the graph has no figure to patch (first render, a response the
+# browser dropped for a newer one, a drill-down) and gets the full figure;
+# the store lives in the same response, so it never claims a figure that was
+# not applied.
+def patch_traces(fig, *keys):
+    """A Patch that only replaces ``keys`` of every trace of ``fig``.
+
+    Used once a graph already shows its figure, so a year or region change
+    only sends the data arrays that moved instead of the whole figure.
+    """
+    patch = Patch()
+    for index, trace in enumerate(fig['data']):
+        for key in keys:
+            patch['data'][index][key] = trace[key]
+    return patch
 
 # --------------------------------------
 
-app.layout = html.Div(children=[
+layout = html.Div(children=[
+    dcc.Store(id='clientside-data', data=clientside_data() if clientside_mode else None),
+    dcc.Store(id='clientside-fingerprint', data=registry.fingerprint if clientside_mode else None),
     navbar, # Left Image
     html.Div(children=[
         # # Left Sidebar
@@ -131,12 +323,14 @@ app.layout = html.Div(children=[
                     html.Label("Select a Year:"),
                     dcc.Slider(
                         id='my-slider',
-                        min=2015,
-                        max=2022,
+                        min=data_years[0],
+                        max=data_years[-1],
                         step=1,
-                        value=2015,
-                        marks={year: {'label': str(year)} for year in range(2015, 2023)}
+                        value=data_years[0],
+                        marks=slider_marks
                     ),
+                    dcc.Interval(id='data-poll', interval=max(reload_interval, 1) * 1000,
+                                 disabled=reload_interval <= 0),
                 ], width=9),
                 dbc.Col([
                     html.Label("Select a Region:"),
@@ -190,7 +384,8 @@ app.layout = html.Div(children=[
             dbc.Row([
                 dbc.Col([
                     html.H2(id="line-title", style={'textAlign': 'center', 'color': 'black', 'fontFamily': 'Roboto, sans-serif', 'fontWeight': 'bold', 'marginTop': '20px'}),
-                    dcc.Graph(id='line-graph-hazardous-wastes', style={'height': '400px'}),
+                    dcc.Loading(dcc.Graph(id='line-graph-hazardous-wastes', style={'height': '400px'}), delay_show=300),
+                    dcc.Store(id='line-graph-hazardous-wastes-shown'),
                     html.P("Explore the dynamic landscape of hazardous waste management in the region you've selected through the Total Hazardous Wastes line chart. This visual representation tracks the trends in hazardous waste generation over time, providing valuable insights into the nation's environmental policies and practices. The x-axis denotes the years, offering a chronological view, while the y-axis quantifies the total hazardous waste generated, allowing for a clear understanding of the scale of waste management challenges. The chart's distinct blue color (#48C3FC) ensures easy readability and interpretation of the data. By delving into this chart, stakeholders can uncover patterns, identify areas for improvement, and make informed decisions towards a more sustainable future for the Philippines.")
                     ])
             ], style={'margin': '30px'}),
@@ -205,14 +400,18 @@ app.layout = html.Div(children=[
                         value=dropdown_options[0]['value'],
                         style={'marginBottom': '10px'}  # Default value
                     ),
-                    dcc.Graph(id='choropleth-map'),
+                    dcc.Loading(dcc.Graph(id='choropleth-map'), delay_show=300),
+                    dcc.Store(id='map-detail', data=0),
+                    dcc.Store(id='map-node', data=registry.hierarchy.root),
+                    dcc.Store(id='choropleth-map-shown'),
                     html.P("Explore the spatial distribution of hazardous waste management across the Philippines with our interactive Choropleth Map. This powerful visualization provides a comprehensive overview of the total amount of hazardous waste, and waste per capita per region, alongside key metrics such as the number of illegal dumpsites, Material Recovery Facilities (MRF), sanitary landfills, and registered Treatment, Storage, and Disposal (TSD) facilities. With the ability to toggle between Total Hazardous Wastes, Total Hazardous Wastes per Capita, and Total Waste Disposal Facilities using a dropdown menu, alongside a time slider for historical analysis, users can gain valuable insights into the spatial patterns and trends of waste management practices throughout the Philippines.", style={'marginTop': '30px'})
                     ]),
                 dbc.Col([
                     html.H2(id="area-title", style={'textAlign': 'center', 'color': 'black', 'fontFamily': 'Roboto, sans-serif', 'fontWeight': 'bold'}),
                     dbc.Row([
                         # dbc.Col(dcc.Graph(id='stacked-bar-chart'), width=6),
-                        dbc.Col(dcc.Graph(id='area-chart')),
+                        dbc.Col(dcc.Loading(dcc.Graph(id='area-chart'), delay_show=300)),
+                        dcc.Store(id='area-chart-shown'),
                     html.P("Gain insights into the treatment efficacy of hazardous waste over the years in our Stacked Area Chart. This visualization compares the ratio of total treated hazardous waste to total generated hazardous waste, spanning from 2015 to 2022. By examining the stacked areas, users can discern trends and similarities in treatment effectiveness over time, enabling informed decision-making for sustainable waste management practices.", style={'marginTop': '30px'})])
                 ])
             ],
@@ -223,7 +422,8 @@ app.layout = html.Div(children=[
             # Pie Chart -------------------------------
             dbc.Row([
                 html.H2(id="pie-title", style={'textAlign': 'center', 'color': 'black', 'fontFamily': 'Roboto, sans-serif', 'fontWeight': 'bold', 'marginTop': '20px'}),
-                dcc.Graph(id='waste-types-pie-chart'),
+                dcc.Loading(dcc.Graph(id='waste-types-pie-chart'), delay_show=300),
+                dcc.Store(id='waste-types-pie-chart-shown'),
                 html.P("Explore the composition of hazardous waste by region through our informative Pie Chart. Each segment of the chart represents a different type of hazardous waste, categorized by color for easy identification. From wastes containing cyanide to organic chemicals, and miscellaneous wastes, this visualization provides a clear depiction of the part-to-whole relationship within each region. Delve into the chart to understand the distribution of various hazardous waste types across different regions, empowering stakeholders to make informed decisions for effective waste management strategies.")
             ], style={'marginBottom': '30px'})
 
@@ -238,32 +438,69 @@ app.layout = html.Div(children=[
     
 ])
 
+# Every page load gets its own id, so that one tab's requests never
+# supersede another's (see build_figure)
+def serve_layout():
+    return html.Div([dcc.Store(id='page-id', data=uuid.uuid4().hex), layout])
+
+app.layout = serve_layout
+
 
 # -------------------------------------
-# Key Cards - Callback/Function
+# Time Slider - Callback
+# Follows the years on disk after a reload, without moving the selected year
 
 @callback(
+    Output('my-slider', 'min'),
+    Output('my-slider', 'max'),
+    Output('my-slider', 'marks'),
+    Input('data-poll', 'n_intervals'),
+    State('my-slider', 'marks')
+)
+def update_slider_range(_, marks):
+    years = registry.years
+    if list(marks) == [str(year) for year in years]:
+        raise PreventUpdate
+
+    return years[0], years[-1], {year: {'label': str(year)} for year in years}
+
+# The browser's copy of the fact table follows reloads too; the fingerprint
+# tells whether it is out of date without sending the table back
+if clientside_mode:
+    @callback(
+        Output('clientside-data', 'data'),
+        Output('clientside-fingerprint', 'data'),
+        Input('data-poll', 'n_intervals'),
+        State('clientside-fingerprint', 'data')
+    )
+    def update_clientside_data(_, fingerprint):
+        if fingerprint == registry.fingerprint:
+            raise PreventUpdate
+
+        return clientside_data(), registry.fingerprint
+
+# -------------------------------------
+# Key Cards - Callback/Function
+
+@offloadable_callback(
     Output('waste-generated', 'children'),
     Output('waste-facilities', 'children'),
     Output('average-population-density', 'children'),
     [Input('my-slider', 'value'),
      Input('region-select-dropdown', 'value')] 
 )
-
+@metrics.instrument
+@memoize(figure_cache, version=year_version)
 def update_metrics(selected_year, selected_region):
-    df_selected_year = datasets_by_year[selected_year]
-    filtered_df = df_selected_year[df_selected_year['Region'] == selected_region]
-
-    filtered_df['Total Hazardous Wastes'] = pd.to_numeric(filtered_df['Total Hazardous Wastes'], errors='coerce')
-    filtered_df['Illegal Dumpsites'] = pd.to_numeric(filtered_df['Illegal Dumpsites'])
-    filtered_df['Materials Recovery Facility'] = pd.to_numeric(filtered_df['Materials Recovery Facility'])
-    filtered_df['Sanitary Landfill'] = pd.to_numeric(filtered_df['Sanitary Landfill'])
-    filtered_df['Registered TSD Facilities'] = pd.to_numeric(filtered_df['Registered TSD Facilities'])
-    filtered_df['Population'] = pd.to_numeric(filtered_df['Population'], errors='coerce')
+    if selected_region not in registry.hierarchy:
+        # Cleared dropdown: no row, so zeros (and no population)
+        return '0.00', '0', 'nan'
+    row = registry.year(selected_year)['facts'].loc[(selected_year, selected_region)]
 
-    total_waste = filtered_df['Total Hazardous Wastes'].sum()
-    waste_facilities = filtered_df[['Illegal Dumpsites', 'Materials Recovery Facility', 'Sanitary Landfill', 'Registered TSD Facilities']].sum().sum()
-    average_population_density = filtered_df['Population'].mean()
+    total_waste = row['Total Hazardous Wastes']
+    waste_facilities = row[FACILITY_COLUMNS].sum()
+    average_population_density = row['Population']
+    metrics.lap('data')
 
     # Using str.format()
     # Adding comma between numbers
@@ -291,44 +528,65 @@ def update_metrics(selected_year, selected_region):
 # ---------------------------------------------
 # Line Graph - Callback/Function
 
-@app.callback(
-    Output('line-graph-hazardous-wastes', 'figure'),
-    Output('line-title', 'children'),
-    [Input('region-select-dropdown', 'value')]
-)
-def update_line_graph(selected_region):
+def region_history(selected_region, columns):
+    """``columns`` of a node's Year-indexed series; zeros for every year when no node is selected."""
+    series = registry.region_series.get(selected_region)
+    if series is None:
+        return pd.DataFrame(0.0, index=pd.Index(registry.years, name='Year'), columns=columns)
+    return series[columns]
 
-    target_region = selected_region
+@memoize(figure_cache, version=series_version)
+def line_figure(selected_region):
 
-    yearly_data_for_region = []
+    region_df = region_history(selected_region, ['Total Hazardous Wastes']).reset_index()
 
-    for year, df in datasets_by_year.items():
-        total_waste = df.loc[df['Region'] == target_region, 'Total Hazardous Wastes'].sum()
-        yearly_data_for_region.append((year, total_waste))
-
-    # Convert the list to a DataFrame for easier plotting
-    region_df = pd.DataFrame(yearly_data_for_region, columns=['Year', 'Total Hazardous Wastes'])
-
-    region_df['Total Hazardous Wastes'] = pd.to_numeric(region_df['Total Hazardous Wastes'])
+    metrics.lap('data')
 
     fig = px.line(region_df, x='Year', y='Total Hazardous Wastes')
+    metrics.lap('figure')
 
     lineTitle = f'Total Hazardous Wastes for {selected_region}'
 
     return fig, lineTitle
 
-# -------------------------------------
-# Choropleth - Callback/Function
-@callback(
-    Output('choropleth-map', 'figure'),
-    Output('chor-title', 'children'),
-    [Input('column-select-dropdown', 'value'),
-     Input('my-slider', 'value')]  # Add the slider as an input
+@offloadable_callback(
+    Output('line-graph-hazardous-wastes', 'figure'),
+    Output('line-title', 'children'),
+    Output('line-graph-hazardous-wastes-shown', 'data'),
+    [Input('region-select-dropdown', 'value')],
+    State('page-id', 'data'),
+    State('line-graph-hazardous-wastes-shown', 'data')
 )
-def update_map(selected_column, selected_year):
-    gdf_selected_year = geojson_data[selected_year]
+@metrics.instrument
+def update_line_graph(selected_region, page_id, shown):
+    fig, lineTitle = build_figure(page_id, line_figure, selected_region, supersedable=bool(shown))
+    if not shown:
+        return fig, lineTitle, True
 
-    gdf_selected_year.fillna('N/A', inplace=True)
+    # The years too: a reload may have added or removed one since the page loaded
+    return patch_traces(fig, 'x', 'y'), lineTitle, no_update
+
+# -------------------------------------
+# Choropleth - Callback/Function
+@memoize(figure_cache, version=map_version)
+def map_figure(selected_column, selected_year, detail_level, map_node):
+    if map_node == registry.hierarchy.root:
+        gdf_selected_year = registry.year(selected_year)['map_attributes'].loc[selected_year].fillna('N/A')
+        geojson = region_geojson_url(detail_level)
+        center, zoom = {"lat": 12.8797, "lon": 121.7740}, 4
+        uirevision, chorTitle = 'choropleth-map', f'{selected_column} for {selected_year}'
+    else:
+        # Drilled down: the node's children, from their pre-summed rows,
+        # framed on their outlines and never coarser than that zoom needs
+        children = registry.hierarchy.children(map_node)
+        rows = registry.year(selected_year)['facts'].loc[selected_year].loc[children]
+        gdf_selected_year = attributes_from_facts(rows).fillna('N/A')
+        bounds = registry.child_features(map_node)
+        center, zoom = view_for_bounds(bounds['minx'].min(), bounds['miny'].min(),
+                                       bounds['maxx'].max(), bounds['maxy'].max())
+        geojson = child_geojson_url(map_node, max(detail_level, detail_level_for_zoom(zoom)))
+        uirevision, chorTitle = f'choropleth-map-{map_node}', f'{selected_column} in {map_node} for {selected_year}'
+    metrics.lap('data')
 
     # Mapping from column names to color scales
     color_scales_mapping = {
@@ -347,63 +605,107 @@ def update_map(selected_column, selected_year):
     color_scale = color_scales_mapping[selected_column]
 
     fig = px.choropleth_mapbox(gdf_selected_year,
-                               geojson=gdf_selected_year.geometry.__geo_interface__,
+                               geojson=geojson,
                                locations=gdf_selected_year.index,
                                color=selected_column,
                                hover_data=hover_data,
-                               center={"lat": 12.8797, "lon": 121.7740},
+                               center=center,
                                mapbox_style="carto-positron",
-                               zoom=4,
+                               zoom=zoom,
                                color_continuous_scale=color_scale
                                )
     fig.update_layout(margin={"r":0, "t":0, "l":0, "b":0})
 
-    fig.update_layout(coloraxis_colorbar_title_text='')
-
+    # Keep the user's pan/zoom when the figure is rebuilt (until they drill)
+    fig.update_layout(uirevision=uirevision)
 
-    chorTitle = f'{selected_column} for {selected_year}'
+    fig.update_layout(coloraxis_colorbar_title_text='')
+    metrics.lap('figure')
 
     return fig, chorTitle
 
-# -------------------------------------
-# Stacked Bar/Area Chart - Callback/Function
 @callback(
-
-        # Output('stacked-bar-chart', 'figure'),
-     Output('area-chart', 'figure'),
-    Output('area-title', 'children'),
-    [Input('region-select-dropdown', 'value')]
+    Output('choropleth-map', 'figure'),
+    Output('chor-title', 'children'),
+    Output('choropleth-map-shown', 'data'),
+    [Input('column-select-dropdown', 'value'),
+     Input('my-slider', 'value'),  # Add the slider as an input
+     Input('map-detail', 'data'),
+     Input('map-node', 'data')],
+    State('page-id', 'data'),
+    State('choropleth-map-shown', 'data')
 )
-def update_charts(selected_region):
-
-    # Treated DF
-    target_region = selected_region
-
-    yearly_data_for_region = []
-
-    for year, df in datasets_by_year.items():
-        treated_waste = df.loc[df['Region'] == target_region, 'Total Treated Hazardous Wastes'].sum()
-        yearly_data_for_region.append((year, treated_waste))
-
-    treated_df = pd.DataFrame(yearly_data_for_region, columns=['Year', 'Total Treated Hazardous Wastes'])
-
-    # Hazardous DF
+@metrics.instrument
+def update_map(selected_column, selected_year, detail_level, map_node, page_id, shown):
+    # A drill-down moves the view, so it needs the whole figure
+    full = shown != map_node
+    fig, chorTitle = build_figure(page_id, map_figure, selected_column, selected_year, detail_level, map_node,
+                                  supersedable=not full)
+    if full:
+        return fig, chorTitle, map_node
+
+    # Within one node only the outline URL (zoom level), the colours and
+    # hover values (year, metric) and the region order they follow (a year's
+    # file added by a reload may list its regions in another order) change.
+    # All of them are sent whatever triggered the update, since the browser
+    # drops a pending response when a newer one is requested
+    patch = patch_traces(fig, 'geojson', 'locations', 'z', 'customdata', 'hovertemplate')
+    patch['layout']['coloraxis']['colorscale'] = fig['layout']['coloraxis']['colorscale']
+    return patch, chorTitle, no_update
+
+# Switch to a finer polygon set when the user zooms in, and back when zooming out
+@callback(
+    Output('map-detail', 'data'),
+    Input('choropleth-map', 'relayoutData'),
+    State('map-detail', 'data')
+)
+def update_map_detail(relayout_data, current_level):
+    zoom = (relayout_data or {}).get('mapbox.zoom')
+    if zoom is None:
+        raise PreventUpdate
 
-    yearly_data_for_region = []
+    level = detail_level_for_zoom(zoom)
+    if level == current_level:
+        raise PreventUpdate
 
-    for year, df in datasets_by_year.items():
-        hazardous_waste = df.loc[df['Region'] == target_region, 'Total Hazardous Wastes'].sum()
-        yearly_data_for_region.append(( hazardous_waste))
+    return level
 
-    hazardous_df = pd.DataFrame(yearly_data_for_region, columns=[ 'Total Hazardous Wastes'])
+# -------------------------------------
+# Drill-down - Callbacks
+# Only datasets with provinces or municipalities have anything to drill into
+if registry.admin_levels:
+    @callback(
+        Output('region-select-dropdown', 'options'),
+        Input('region-select-dropdown', 'value')
+    )
+    def update_region_options(selected_region):
+        if selected_region not in registry.hierarchy:
+            return registry.hierarchy.options(registry.hierarchy.root)
+        return registry.hierarchy.options(selected_region)
+
+    # The map shows the selected node's children, or its siblings for a leaf
+    @callback(
+        Output('map-node', 'data'),
+        Input('region-select-dropdown', 'value'),
+        State('map-node', 'data')
+    )
+    def update_map_node(selected_region, current_node):
+        if selected_region not in registry.hierarchy:
+            raise PreventUpdate
+        node = registry.hierarchy.map_node(selected_region)
+        if node == current_node:
+            raise PreventUpdate
 
-    #Concatenate treated and total hazardous waste
-    wastes_combined = pd.concat([treated_df, hazardous_df], axis = 1)
+        return node
 
-    wastes_combined.columns = ['Year', 'Total Treated Hazardous Wastes', 'Total Hazardous Wastes']
+# -------------------------------------
+# Stacked Bar/Area Chart - Callback/Function
+@memoize(figure_cache, version=series_version)
+def area_figure(selected_region):
 
-    wastes_combined['Total Treated Hazardous Wastes'] = pd.to_numeric(wastes_combined['Total Treated Hazardous Wastes'])
-    wastes_combined['Total Hazardous Wastes'] = pd.to_numeric(wastes_combined['Total Hazardous Wastes'])
+    wastes_combined = region_history(
+        selected_region, ['Total Treated Hazardous Wastes', 'Total Hazardous Wastes']).reset_index()
+    metrics.lap('data')
 
     # Stacked bar chart
     # fig_bar = px.bar(wastes_combined,
@@ -430,48 +732,39 @@ def update_charts(selected_region):
         )
     )
 
+    metrics.lap('figure')
+
     areaTitle = f"Waste Management Trends for {selected_region}"
 
     return fig_area, areaTitle #fig_bar,
 
+@offloadable_callback(
+
+        # Output('stacked-bar-chart', 'figure'),
+     Output('area-chart', 'figure'),
+    Output('area-title', 'children'),
+    Output('area-chart-shown', 'data'),
+    [Input('region-select-dropdown', 'value')],
+    State('page-id', 'data'),
+    State('area-chart-shown', 'data')
+)
+@metrics.instrument
+def update_charts(selected_region, page_id, shown):
+    fig_area, areaTitle = build_figure(page_id, area_figure, selected_region, supersedable=bool(shown))
+    if not shown:
+        return fig_area, areaTitle, True
+
+    return patch_traces(fig_area, 'x', 'y'), areaTitle, no_update
+
 # -----------------------------------------
 # Pie Chart - Callback/Function
 
-@app.callback(
-    Output('waste-types-pie-chart', 'figure'),
-    Output('pie-title', 'children'),
-    [Input('my-slider', 'value'),
-     Input('region-select-dropdown', 'value')]
-)
-def update_pie_chart(selected_year, selected_region):
-    df_selected_year = datasets_by_year[selected_year]
-
-    df_filtered = df_selected_year[df_selected_year['Region'] == selected_region]
-
-    # extract only the waste columns 
-    waste_columns = df_filtered.columns[
-                    df_filtered.columns.get_loc('Wastes with Cyanide'):df_filtered.columns.get_loc('Miscellaneous Wastes')+1]
-
-    # Convert the waste data columns to numeric
-    df_filtered[waste_columns] = df_filtered[waste_columns].applymap(pd.to_numeric, errors='coerce')
-
-    waste_data = df_filtered[waste_columns].sum()
-
-    category_colors = {
-        'Wastes with Cyanide': '#E69F00',  # Orange
-        'Acid Wastes': '#56B4E9',  # Sky Blue
-        'Alkali Wastes': '#009E73',  # Bluish Green
-        'Wastes with Inorganic Chemicals': '#F0E442',  # Bright Yellow
-        'Reactive Chemical Wastes': '#0072B2',  # Blue
-        'Inks/Dyes/Pigments/Paint/Latex/Adhesives/Organic Sludge': '#D55E00',  # Vermilion
-        'Waste Organic Solvents': '#CC79A7',  # Reddish Purple
-        'Organic Wastes': '#999999',  # Grey
-        'Oil': '#000000',  # Black
-        'Containers': '#BBBBBB',  # Light Gray
-        'Stabilized Wastes': '#000075',  # Dark Blue
-        'Organic Chemicals': '#A9A9A9',  # Dark Gray
-        'Miscellaneous Wastes': '#FBFCF8',  # White
-    }
+@memoize(figure_cache, version=year_version)
+def pie_figure(selected_year, selected_region):
+    if selected_region in registry.hierarchy:
+        waste_data = registry.year(selected_year)['facts'].loc[(selected_year, selected_region), WASTE_TYPE_COLUMNS]
+    else:
+        waste_data = pd.Series(0.0, index=WASTE_TYPE_COLUMNS)
 
 
     # DataFrame for plotting
@@ -483,6 +776,7 @@ def update_pie_chart(selected_year, selected_region):
     # default color for missing
     default_color = '#808080'  # Gray as default
     plot_data['Color'].fillna(default_color, inplace=True)
+    metrics.lap('data')
 
     fig = px.pie(
         plot_data,
@@ -498,10 +792,29 @@ def update_pie_chart(selected_year, selected_region):
         ))
 
 
+    metrics.lap('figure')
+
     pieTitle = f'Types of Waste for {selected_region} in {selected_year}'
 
     return fig, pieTitle
 
+@offloadable_callback(
+    Output('waste-types-pie-chart', 'figure'),
+    Output('pie-title', 'children'),
+    Output('waste-types-pie-chart-shown', 'data'),
+    [Input('my-slider', 'value'),
+     Input('region-select-dropdown', 'value')],
+    State('page-id', 'data'),
+    State('waste-types-pie-chart-shown', 'data')
+)
+@metrics.instrument
+def update_pie_chart(selected_year, selected_region, page_id, shown):
+    fig, pieTitle = build_figure(page_id, pie_figure, selected_year, selected_region, supersedable=bool(shown))
+    if not shown:
+        return fig, pieTitle, True
+
+    return patch_traces(fig, 'values'), pieTitle, no_update
+
 
 
 if __name__ == '__main__':
@@ -0,0 +1,169 @@
+// Clientside versions of the key-card, line, area and pie callbacks in app.py.
+// Only registered when the app runs with DASHBOARD_CLIENTSIDE=1; `data` is the
+// 'clientside-data' store: the fact table as columns, the pie colours and the
+// plotly template the server-side figures use. The figures are always drawn
+// whole here, so each graph's '-shown' store is simply set.
+
+function rowIndex(table, year, region) {
+    for (let i = 0; i < table.Year.length; i++) {
+        if (table.Year[i] === year && table.Region[i] === region) {
+            return i;
+        }
+    }
+    return -1;
+}
+
+function regionRows(table, region) {
+    const rows = [];
+    for (let i = 0; i < table.Year.length; i++) {
+        if (table.Region[i] === region) {
+            rows.push(i);
+        }
+    }
+    return rows.sort((a, b) => table.Year[a] - table.Year[b]);
+}
+
+// Every year in the table, ascending
+function tableYears(table) {
+    return Array.from(new Set(table.Year)).sort((a, b) => a - b);
+}
+
+// Same output as Python's '{:,.Nf}'.format(value)
+function formatNumber(value, digits) {
+    if (value === null || value === undefined || Number.isNaN(value)) {
+        return 'nan';
+    }
+    return value.toLocaleString('en-US', {
+        minimumFractionDigits: digits,
+        maximumFractionDigits: digits
+    });
+}
+
+const FACILITY_COLUMNS = [
+    'Illegal Dumpsites',
+    'Materials Recovery Facility',
+    'Sanitary Landfill',
+    'Registered TSD Facilities'
+];
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    dashboard: {
+        update_metrics: function(selectedYear, selectedRegion, data) {
+            const table = data.table;
+            const i = rowIndex(table, selectedYear, selectedRegion);
+            if (i < 0) {
+                return ['0.00', '0', 'nan'];
+            }
+
+            let facilities = 0;
+            FACILITY_COLUMNS.forEach(function(column) {
+                if (table[column][i] !== null) {
+                    facilities += table[column][i];
+                }
+            });
+
+            return [
+                formatNumber(table['Total Hazardous Wastes'][i], 2),
+                formatNumber(facilities, 0),
+                formatNumber(table.Population[i], 0)
+            ];
+        },
+
+        update_line_graph: function(selectedRegion, pageId, shown, data) {
+            const table = data.table;
+            const rows = regionRows(table, selectedRegion);
+            // Cleared dropdown: zeros for every year, as on the server
+            const years = rows.length ? rows.map(i => table.Year[i]) : tableYears(table);
+            const values = column => (rows.length ? rows.map(i => table[column][i]) : years.map(() => 0));
+            const figure = {
+                data: [{
+                    type: 'scatter',
+                    mode: 'lines',
+                    x: years,
+                    y: values('Total Hazardous Wastes'),
+                    line: {color: '#636efa', dash: 'solid'},
+                    hovertemplate: 'Year=%{x}<br>Total Hazardous Wastes=%{y}<extra></extra>',
+                    showlegend: false,
+                    name: ''
+                }],
+                layout: {
+                    template: data.template,
+                    xaxis: {title: {text: 'Year'}},
+                    yaxis: {title: {text: 'Total Hazardous Wastes'}},
+                    legend: {tracegroupgap: 0},
+                    margin: {t: 60}
+                }
+            };
+            return [figure, 'Total Hazardous Wastes for ' + selectedRegion, true];
+        },
+
+        update_charts: function(selectedRegion, pageId, shown, data) {
+            const table = data.table;
+            const rows = regionRows(table, selectedRegion);
+            const years = rows.length ? rows.map(i => table.Year[i]) : tableYears(table);
+            const values = column => (rows.length ? rows.map(i => table[column][i]) : years.map(() => 0));
+            const colors = ['#636efa', '#EF553B'];
+            const columns = ['Total Treated Hazardous Wastes', 'Total Hazardous Wastes'];
+            const figure = {
+                data: columns.map(function(column, k) {
+                    return {
+                        type: 'scatter',
+                        mode: 'lines',
+                        stackgroup: '1',
+                        name: column,
+                        legendgroup: column,
+                        x: years,
+                        y: values(column),
+                        line: {color: colors[k]},
+                        hovertemplate: 'Waste Type=' + column + '<br>Year=%{x}<br>Volume=%{y}<extra></extra>'
+                    };
+                }),
+                layout: {
+                    template: data.template,
+                    xaxis: {title: {text: 'Year'}},
+                    yaxis: {title: {text: 'Volume'}},
+                    legend: {
+                        title: {text: 'Waste Type'},
+                        tracegroupgap: 0,
+                        orientation: 'h',
+                        yanchor: 'top',
+                        y: -0.2,
+                        xanchor: 'center',
+                        x: 0.5
+                    },
+                    margin: {t: 60}
+                }
+            };
+            return [figure, 'Waste Management Trends for ' + selectedRegion, true];
+        },
+
+        update_pie_chart: function(selectedYear, selectedRegion, pageId, shown, data) {
+            const table = data.table;
+            const i = rowIndex(table, selectedYear, selectedRegion);
+            const labels = Object.keys(data.colors);
+            const figure = {
+                data: [{
+                    type: 'pie',
+                    labels: labels,
+                    values: labels.map(label => (i < 0 ? 0 : table[label][i])),
+                    customdata: labels.map(label => [label]),
+                    marker: {colors: labels.map(label => data.colors[label])},
+                    hovertemplate: 'Waste Type=%{customdata[0]}<br>Amount=%{value}<extra></extra>',
+                    showlegend: true,
+                    name: ''
+                }],
+                layout: {
+                    template: data.template,
+                    legend: {
+                        tracegroupgap: 0,
+                        title: {text: 'Waste Types'},
+                        itemdoubleclick: false,
+                        itemclick: false
+                    },
+                    margin: {t: 60}
+                }
+            };
+            return [figure, 'Types of Waste for ' + selectedRegion + ' in ' + selectedYear, true];
+        }
+    }
+});
@@ -0,0 +1,244 @@
+"""Benchmarks for startup, callbacks and request throughput.
+
+Runs against the real ``datasets/`` files from the repository root, or
+against a generated dataset (see ``dashboard.synthetic``):
+
+    python benchmarks/run.py --out bench.json
+    python benchmarks/run.py --baseline bench.json --tolerance 0.25
+    python benchmarks/run.py --dataset-folder .cache/synthetic --out bench-synthetic.json
+
+Each stage runs in a fresh interpreter so imports and caches start cold:
+
+* ``startup``: import time of ``app.py`` and time to load all data, with an
+  empty and with a current dataset cache, plus peak RSS;
+* ``callbacks``: latency of every figure builder for every year / region /
+  metric input, with the figure cache disabled;
+* ``load``: requests per second and p50/p99 latency of
+  ``_dash-update-component`` through Flask's test client, from several
+  threads issuing random slider/dropdown changes.
+
+Results are written as JSON. With ``--baseline`` every timing is compared
+to an earlier run and the exit status is 1 if any regressed by more than
+``--tolerance``.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def summarize(seconds):
+    return {
+        'count': len(seconds),
+        'mean_ms': statistics.fmean(seconds) * 1000,
+        'p50_ms': percentile(seconds, 0.5) * 1000,
+        'p99_ms': percentile(seconds, 0.99) * 1000,
+        'max_ms': max(seconds) * 1000,
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def stage_startup():
+    start = time.perf_counter()
+    import app
+    imported = time.perf_counter()
+    app.registry.warm()
+    loaded = time.perf_counter()
+    return {
+        'import_s': imported - start,
+        'load_s': loaded - imported,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def stage_callbacks():
+    import app
+    from dashboard.prerender import callback_inputs
+
+    app.registry.warm()
+    timings = {}
+    for name, args in callback_inputs(app):
+        start = time.perf_counter()
+        getattr(app, name)(*args)
+        timings.setdefault(name, []).append(time.perf_counter() - start)
+    return {name: summarize(seconds) for name, seconds in timings.items()}
+
+
+def update_request(outputs, inputs, changed, state=()):
+    return {
+        'output': '..' + '...'.join(f'{id}.{prop}' for id, prop in outputs) + '..',
+        'outputs': [{'id': id, 'property': prop} for id, prop in outputs],
+        'inputs': [{'id': id, 'property': prop, 'value': value} for id, prop, value in inputs],
+        'changedPropIds': changed,
+        'state': [{'id': id, 'property': prop, 'value': value} for id, prop, value in state],
+    }
+
+
+def random_request(app, rng):
+    """One callback request as the browser would send it after a control change."""
+    year = rng.choice(list(app.data_years))
+    region = rng.choice(app.registry.hierarchy.names)
+    metric = rng.choice(app.dropdown_options)['value']
+    map_node = app.registry.hierarchy.map_node(region)
+    # Half initial renders (full figures), half control changes (patches)
+    initial = rng.random() < 0.5
+
+    def shown(graph, value=True):
+        # No page id: the benchmark's requests never supersede each other
+        return [('page-id', 'data', None), (f'{graph}-shown', 'data', None if initial else value)]
+
+    requests = [
+        ([('waste-generated', 'children'), ('waste-facilities', 'children'),
+          ('average-population-density', 'children')],
+         [('my-slider', 'value', year), ('region-select-dropdown', 'value', region)], []),
+        ([('line-graph-hazardous-wastes', 'figure'), ('line-title', 'children'),
+          ('line-graph-hazardous-wastes-shown', 'data')],
+         [('region-select-dropdown', 'value', region)], shown('line-graph-hazardous-wastes')),
+        ([('choropleth-map', 'figure'), ('chor-title', 'children'), ('choropleth-map-shown', 'data')],
+         [('column-select-dropdown', 'value', metric), ('my-slider', 'value', year), ('map-detail', 'data', 0),
+          ('map-node', 'data', map_node)], shown('choropleth-map', map_node)),
+        ([('area-chart', 'figure'), ('area-title', 'children'), ('area-chart-shown', 'data')],
+         [('region-select-dropdown', 'value', region)], shown('area-chart')),
+        ([('waste-types-pie-chart', 'figure'), ('pie-title', 'children'), ('waste-types-pie-chart-shown', 'data')],
+         [('my-slider', 'value', year), ('region-select-dropdown', 'value', region)], shown('waste-types-pie-chart')),
+    ]
+    outputs, inputs, state = rng.choice(requests)
+    changed = [] if initial else [f'{inputs[0][0]}.{inputs[0][1]}']
+    return update_request(outputs, inputs, changed, state)
+
+
+def stage_load(requests, threads):
+    import app
+
+    app.registry.warm()
+    app.app.server.test_client().get('/')
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(seed, count):
+        rng = random.Random(seed)
+        client = app.app.server.test_client()
+        for _ in range(count):
+            body = random_request(app, rng)
+            start = time.perf_counter()
+            response = client.post('/_dash-update-component', json=body,
+                                   headers={'Accept-Encoding': 'gzip'})
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(seed, requests // threads)) for seed in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'threads': threads,
+        'errors': len(errors),
+        'requests_per_s': len(latencies) / elapsed,
+        **summarize(latencies),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_stage(stage, env=None, extra=()):
+    """Run one stage in a fresh interpreter and return its JSON result."""
+    env = {**os.environ, 'DASHBOARD_BACKGROUND_WARMUP': '0', **(env or {})}
+    output = subprocess.run([sys.executable, __file__, '--stage', stage, *extra],
+                            cwd=ROOT, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_all(requests, threads, dataset_folder=None):
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = {'DASHBOARD_CACHE_DIR': cache_dir}
+        if dataset_folder:
+            env['DASHBOARD_DATASET_FOLDER'] = str(Path(dataset_folder).resolve())
+        results['startup_cold_cache'] = run_stage('startup', env)
+        results['startup_warm_cache'] = run_stage('startup', env)
+        results['callbacks'] = run_stage('callbacks', {**env, 'DASHBOARD_FIGURE_CACHE_MB': '0'})
+        results['load'] = run_stage('load', env, ['--requests', str(requests), '--threads', str(threads)])
+    return results
+
+
+# Lower is better for every one of these
+COMPARED_KEYS = ('import_s', 'load_s', 'peak_rss_mb', 'mean_ms', 'p50_ms', 'p99_ms')
+
+
+def regressions(current, baseline, tolerance, path=''):
+    found = []
+    for key, value in current.items():
+        previous = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            found += regressions(value, previous or {}, tolerance, f'{path}{key}.')
+        elif key in COMPARED_KEYS and previous and value > previous * (1 + tolerance):
+            found.append(f'{path}{key}: {previous:.3f} -> {value:.3f}')
+        elif key == 'requests_per_s' and previous and value < previous * (1 - tolerance):
+            found.append(f'{path}{key}: {previous:.1f} -> {value:.1f}')
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard.')
+    parser.add_argument('--out', type=Path, help='write the results to this JSON file')
+    parser.add_argument('--baseline', type=Path, help='fail if slower than this earlier result file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown (default: 25%%)')
+    parser.add_argument('--requests', type=int, default=2000, help='requests for the load stage')
+    parser.add_argument('--threads', type=int, default=4, help='client threads for the load stage')
+    parser.add_argument('--dataset-folder', type=Path, help='benchmark this dataset instead of datasets/')
+    parser.add_argument('--stage', choices=['startup', 'callbacks', 'load'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        sys.path.insert(0, str(ROOT))
+        result = {
+            'startup': stage_startup,
+            'callbacks': stage_callbacks,
+            'load': lambda: stage_load(args.requests, args.threads),
+        }[args.stage]()
+        print(json.dumps(result))
+        return
+
+    results = run_all(args.requests, args.threads, args.dataset_folder)
+    text = json.dumps(results, indent=2)
+    if args.out:
+        args.out.write_text(text + '\n')
+    print(text)
+
+    if args.baseline:
+        found = regressions(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for line in found:
+            print(f'REGRESSION {line}', file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""Data and serving helpers for the What a Waste! dashboard (see app.py)."""
@@ -0,0 +1,94 @@
+"""Figure builds on a bounded thread pool, with superseded requests dropped.
+
+Scrubbing the year slider sends a burst of callbacks per graph. Builds run on
+a small pool (``DASHBOARD_BUILD_THREADS``, default 2) instead of on every
+request thread at once. When a newer request for the same graph arrives from
+the same browser, the older one stops waiting and, if its build has not
+started yet, the build is dropped; the browser only ever shows the newest
+answer anyway. A newer request for the very same figure does not supersede
+the older one; both get the one result, and neither does a request that
+will send the graph its whole figure (``supersedable=False``), since the
+browser has nothing to patch until that arrives. Identical builds already in
+flight for another page are shared instead of repeated.
+
+Pages are told apart by the id the layout gives every page load (so two
+tabs never supersede each other); requests without one are never
+superseded.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_THREADS = int(os.environ.get('DASHBOARD_BUILD_THREADS', '2'))
+
+
+class Superseded(Exception):
+    """A newer request for another figure in the same graph of the same page replaced this one."""
+
+
+class _Ticket:
+    def __init__(self, key, supersedable):
+        self.key = key
+        self.supersedable = supersedable
+        self.event = threading.Event()
+        self.superseded = False
+
+
+class BackgroundBuilds:
+    def __init__(self, threads=DEFAULT_THREADS):
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='figure-build')
+        self.lock = threading.Lock()
+        self.latest = {}
+        self.in_flight = {}
+        self.waiters = {}
+
+    def run(self, page, slot, key, func, *args, supersedable=True):
+        """Return ``func(*args)``, built on the pool.
+
+        ``key`` identifies the result, so identical builds are shared.
+        ``slot`` names the graph: a later call with the same ``page`` and
+        ``slot`` but another ``key`` makes this one raise ``Superseded``,
+        unless it was made with ``supersedable=False``.
+        """
+        ticket = _Ticket(key, supersedable)
+        with self.lock:
+            if page is not None:
+                waiting = self.latest.setdefault((page, slot), [])
+                if waiting and waiting[0].key != key:
+                    for previous in waiting:
+                        if previous.supersedable:
+                            previous.superseded = True
+                            previous.event.set()
+                    waiting.clear()
+                waiting.append(ticket)
+
+            self.waiters.setdefault(key, []).append(ticket)
+            future = self.in_flight.get(key)
+            if future is None:
+                future = self.in_flight[key] = self.pool.submit(self._build, key, func, args)
+        future.add_done_callback(lambda _: ticket.event.set())
+
+        ticket.event.wait()
+        with self.lock:
+            waiting = self.latest.get((page, slot), [])
+            if ticket in waiting:
+                waiting.remove(ticket)
+                if not waiting:
+                    del self.latest[page, slot]
+        if ticket.superseded and not future.done():
+            raise Superseded()
+        return future.result()
+
+    def _build(self, key, func, args):
+        with self.lock:
+            if all(ticket.superseded for ticket in self.waiters[key]):
+                # Nobody wants this any more; forget it before anyone else can join
+                del self.in_flight[key]
+                del self.waiters[key]
+                raise Superseded()
+        try:
+            return func(*args)
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+                del self.waiters[key]
@@ -0,0 +1,463 @@
+"""Waste statistics as one typed table indexed by (Year, Region).
+
+The cleaned yearly CSVs in ``datasets/waste_data/new`` are parsed once at
+startup; callbacks read single rows or columns from the result instead of
+re-parsing strings on every request. ``DataRegistry`` loads the parsed tables
+and encoded map outlines lazily through the binary cache of
+``dashboard.datacache``. When the dataset has provinces or municipalities
+(see ``dashboard.hierarchy``), their rows, summed up to every level, are part
+of the same table.
+
+Yearly files added or replaced while the app is running are picked up by
+``DataRegistry.refresh``, which only reads the years that changed.
+
+Run ``python -m dashboard.data`` to (re)build that cache ahead of time.
+"""
+import argparse
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from dashboard import datacache
+from dashboard.hierarchy import ADMIN_LEVELS, Hierarchy, build_nodes, roll_up
+
+# Point at another dataset (e.g. one from ``dashboard.synthetic``) with
+# DASHBOARD_DATASET_FOLDER
+DATASET_FOLDER = Path(os.environ.get('DASHBOARD_DATASET_FOLDER', 'datasets'))
+
+logger = logging.getLogger(__name__)
+
+FACILITY_COLUMNS = [
+    'Illegal Dumpsites',
+    'Materials Recovery Facility',
+    'Sanitary Landfill',
+    'Registered TSD Facilities',
+]
+
+WASTE_TYPE_COLUMNS = [
+    'Wastes with Cyanide',
+    'Acid Wastes',
+    'Alkali Wastes',
+    'Wastes with Inorganic Chemicals',
+    'Reactive Chemical Wastes',
+    'Inks/Dyes/Pigments/Paint/Latex/Adhesives/Organic Sludge',
+    'Waste Organic Solvents',
+    'Organic Wastes',
+    'Oil',
+    'Containers',
+    'Stabilized Wastes',
+    'Organic Chemicals',
+    'Miscellaneous Wastes',
+]
+
+TONNAGE_COLUMNS = WASTE_TYPE_COLUMNS + ['Total Hazardous Wastes', 'Total Treated Hazardous Wastes']
+
+MEASURE_COLUMNS = FACILITY_COLUMNS + TONNAGE_COLUMNS + ['Population']
+
+# Facility counts have gaps, so they stay floating point; float32 holds them
+# exactly. Tonnages stay float64 because float32 loses the cents shown on the
+# national key card.
+COLUMN_DTYPES = {
+    **{column: 'float32' for column in FACILITY_COLUMNS},
+    **{column: 'float64' for column in TONNAGE_COLUMNS},
+    'Population': 'int32',
+}
+
+
+def load_fact_table(paths_by_year, categories=None):
+    """Read the yearly CSVs into one table indexed by (Year, Region)."""
+    frames = []
+    for year, path in paths_by_year.items():
+        df = pd.read_csv(path, usecols=['Region'] + MEASURE_COLUMNS)
+        df['Year'] = year
+        frames.append(df)
+
+    facts = pd.concat(frames, ignore_index=True).astype(COLUMN_DTYPES)
+    facts['Year'] = facts['Year'].astype('int32')
+
+    # Keep the regions in file order (Philippines first) for the dropdown
+    if categories is None:
+        categories = frames[0]['Region'].unique()
+    facts['Region'] = pd.Categorical(facts['Region'], categories=categories)
+
+    return facts.set_index(['Year', 'Region']).sort_index()[MEASURE_COLUMNS]
+
+
+def add_admin_levels(facts, year, hierarchy, paths_by_level):
+    """Add the finer levels' rows to one year's national/regional ``facts``.
+
+    Levels with a CSV in ``paths_by_level`` are read from it; the others are
+    summed from the level below, deepest first, so every node is looked up
+    rather than aggregated when it is shown.
+    """
+    parents = hierarchy.nodes['Parent']
+    rows = {}
+    for level in range(hierarchy.depth, 1, -1):
+        if level in paths_by_level:
+            rows[level] = pd.read_csv(paths_by_level[level], usecols=['Region'] + MEASURE_COLUMNS).set_index('Region')
+        elif level + 1 in rows:
+            rows[level] = roll_up(rows[level + 1], parents)
+        else:
+            raise ValueError(f'No figures for admin level {level} in {year}: add waste_data/adm{level}/{year}.csv')
+
+    finer = pd.concat([rows[level] for level in sorted(rows)])
+    finer['Year'] = year
+    finer = finer.reset_index(names='Region').astype(COLUMN_DTYPES)
+    finer['Year'] = finer['Year'].astype('int32')
+    finer['Region'] = pd.Categorical(finer['Region'], categories=hierarchy.names)
+
+    facts = facts.reset_index()
+    facts['Region'] = pd.Categorical(facts['Region'].astype(str), categories=hierarchy.names)
+    combined = pd.concat([facts, finer], ignore_index=True)
+    return combined.set_index(['Year', 'Region']).sort_index()[MEASURE_COLUMNS]
+
+
+def discover_years(dataset_folder):
+    """The years that have both a cleaned CSV and a GeoJSON file in ``dataset_folder``, in order."""
+    dataset_folder = Path(dataset_folder)
+    paths = (dataset_folder / 'waste_data' / 'new').glob('*.csv')
+    return sorted(int(path.stem) for path in paths
+                  if path.stem.isdigit() and (dataset_folder / 'geojson' / f'{path.stem}_gdf.geojson').exists())
+
+
+def to_columns(facts):
+    """The fact table as one JSON-ready list per column, with missing values as None."""
+    table = facts.reset_index()
+    table['Region'] = table['Region'].astype(str)
+    return {column: table[column].astype(object).where(table[column].notna(), None).tolist()
+            for column in table.columns}
+
+
+def build_region_series(facts):
+    """Every region's Year-indexed history, so a region's full series is one dict lookup."""
+    return {region: frame.droplevel('Region')
+            for region, frame in facts.groupby(level='Region', observed=True)}
+
+
+def concat_facts(tables):
+    """Stack per-year fact tables, keeping one Region order (first year's first)."""
+    categories = list(dict.fromkeys(region for table in tables for region in table.index.levels[1]))
+    facts = pd.concat([table.reset_index() for table in tables], ignore_index=True)
+    facts['Region'] = pd.Categorical(facts['Region'].astype(str), categories=categories)
+    return facts.set_index(['Year', 'Region']).sort_index()
+
+
+class DataRegistry:
+    """Loads the dataset piece by piece on first use and keeps it loaded.
+
+    Each year's fact rows and map columns, the node hierarchy, the encoded
+    map outlines and each finer level's outlines are separate entries of the
+    binary cache, so answering a request for one year never parses the others
+    and the national view never loads municipal polygons. ``warm_in_background`` loads the rest after the
+    server is already listening. geopandas is only imported when a cache
+    entry has to be rebuilt from the GeoJSON sources.
+    """
+
+    def __init__(self, dataset_folder=DATASET_FOLDER, years=None, cache_dir=datacache.DEFAULT_CACHE_DIR):
+        self.dataset_folder = Path(dataset_folder)
+        self.years = list(years) if years is not None else discover_years(self.dataset_folder)
+        self.cache_dir = Path(cache_dir)
+        self.lock = threading.RLock()
+        self._years = {}
+        self._fingerprints = {}
+        self._facts = None
+        self._region_series = None
+        self._hierarchy = None
+        self._geojson_levels = None
+        self._admin_features = {}
+
+        self.admin_levels = self._discover_admin_levels()
+
+    def csv_path(self, year):
+        return self.dataset_folder / 'waste_data' / 'new' / f'{year}.csv'
+
+    def geojson_path(self, year):
+        return self.dataset_folder / 'geojson' / f'{year}_gdf.geojson'
+
+    def admin_csv_path(self, level, year):
+        return self.dataset_folder / 'waste_data' / f'adm{level}' / f'{year}.csv'
+
+    def admin_geojson_path(self, level):
+        return self.dataset_folder / 'geojson' / f'adm{level}.geojson'
+
+    def _discover_admin_levels(self):
+        # Provinces need a province outline file, municipalities both
+        levels = []
+        for level in ADMIN_LEVELS:
+            if not self.admin_geojson_path(level).exists():
+                break
+            levels.append(level)
+        return levels
+
+    def _admin_csv_paths(self, year):
+        paths = {level: self.admin_csv_path(level, year) for level in self.admin_levels}
+        return {level: path for level, path in paths.items() if path.exists()}
+
+    def _sources(self, name):
+        admin_geojson = [self.admin_geojson_path(level) for level in self.admin_levels]
+        if name == 'geometry':
+            # The polygons are identical in every year's file
+            return [self.geojson_path(self.years[0])]
+        if name == 'hierarchy':
+            return [self.csv_path(self.years[0]), *admin_geojson]
+        if str(name).startswith('adm'):
+            return [self.admin_geojson_path(int(name[3:]))]
+        return [self.csv_path(name), self.geojson_path(name), *self._admin_csv_paths(name).values(), *admin_geojson]
+
+    def _build_year(self, year):
+        from dashboard.geometry import load_attributes
+
+        facts = load_fact_table({year: self.csv_path(year)})
+        if self.admin_levels:
+            facts = add_admin_levels(facts, year, self.hierarchy, self._admin_csv_paths(year))
+        return {
+            'facts': facts,
+            'map_attributes': load_attributes({year: self.geojson_path(year)}),
+        }
+
+    def _build_hierarchy(self):
+        admin_geojson = {level: self.admin_geojson_path(level) for level in self.admin_levels}
+        return {'nodes': build_nodes(self.csv_path(self.years[0]), admin_geojson)}
+
+    def _build_geometry(self):
+        from dashboard.geometry import load_geometry, build_detail_levels
+
+        return {'region_geojson_levels': build_detail_levels(load_geometry(self._sources('geometry')[0]))}
+
+    def _build_admin_features(self, level):
+        from dashboard.geometry import load_admin_geometry, build_feature_table
+
+        return {'features': build_feature_table(load_admin_geometry(self.admin_geojson_path(level)))}
+
+    def _load(self, name, build, rebuild=False):
+        parts, fingerprint = datacache.load(self._sources(name), build,
+                                            cache_dir=self.cache_dir / str(name), rebuild=rebuild)
+        self._fingerprints[name] = fingerprint
+        return parts
+
+    def year(self, year):
+        """The fact rows and map columns of one year."""
+        parts = self._years.get(year)
+        if parts is None:
+            with self.lock:
+                parts = self._years.get(year)
+                if parts is None:
+                    parts = self._years[year] = self._load(year, lambda: self._build_year(year))
+        return parts
+
+    @property
+    def facts(self):
+        """Every year's rows in one table indexed by (Year, Region)."""
+        if self._facts is None:
+            with self.lock:
+                if self._facts is None:
+                    self._facts = concat_facts([self.year(year)['facts'] for year in self.years])
+        return self._facts
+
+    @property
+    def region_series(self):
+        if self._region_series is None:
+            with self.lock:
+                if self._region_series is None:
+                    self._region_series = build_region_series(self.facts)
+        return self._region_series
+
+    @property
+    def hierarchy(self):
+        """The country, its regions and any provinces and municipalities."""
+        if self._hierarchy is None:
+            with self.lock:
+                if self._hierarchy is None:
+                    self._hierarchy = Hierarchy(self._load('hierarchy', self._build_hierarchy)['nodes'])
+        return self._hierarchy
+
+    @property
+    def geojson_levels(self):
+        """The encoded map outlines, one payload per level of detail."""
+        if self._geojson_levels is None:
+            with self.lock:
+                if self._geojson_levels is None:
+                    self._geojson_levels = self._load('geometry', self._build_geometry)['region_geojson_levels']
+        return self._geojson_levels
+
+    def admin_features(self, level):
+        """Bounds and encoded outline per level of detail of every node of a finer ``level``."""
+        features = self._admin_features.get(level)
+        if features is None:
+            with self.lock:
+                features = self._admin_features.get(level)
+                if features is None:
+                    features = self._admin_features[level] = self._load(
+                        f'adm{level}', lambda: self._build_admin_features(level))['features']
+        return features
+
+    def child_features(self, name):
+        """The ``admin_features`` rows of ``name``'s children."""
+        level = self.hierarchy.level(name) + 1
+        return self.admin_features(level).loc[self.hierarchy.children(name)]
+
+    def _combined_fingerprint(self, names):
+        fingerprints = [self._fingerprints.get(name) or
+                        datacache.current_fingerprint(self._sources(name), self.cache_dir / str(name))
+                        for name in names]
+        return hashlib.sha256(''.join(fingerprints).encode('utf-8')).hexdigest()
+
+    def _geometry_entries(self):
+        return ['geometry', 'hierarchy', *(f'adm{level}' for level in self.admin_levels)]
+
+    @property
+    def fingerprint(self):
+        """One hash of every source file, computed without loading or parsing anything."""
+        return self._combined_fingerprint([*self._geometry_entries(), *self.years])
+
+    @property
+    def geometry_fingerprint(self):
+        """One hash of the sources of the map outlines and the node order, but not the yearly figures."""
+        return self._combined_fingerprint(self._geometry_entries())
+
+    def years_fingerprint(self, years, geometry=False):
+        """One hash of the sources of ``years`` and the node order, plus the outlines if ``geometry``.
+
+        ``None`` when one of the years is no longer in the dataset.
+        """
+        if any(year not in self.years for year in years):
+            return None
+        return self._combined_fingerprint([*(self._geometry_entries() if geometry else ['hierarchy']), *years])
+
+    def warm(self, rebuild=False):
+        """Load everything now (rebuilding every cache entry if ``rebuild``)."""
+        if rebuild:
+            with self.lock:
+                self._hierarchy = Hierarchy(self._load('hierarchy', self._build_hierarchy, rebuild=True)['nodes'])
+                for year in self.years:
+                    self._years[year] = self._load(year, lambda year=year: self._build_year(year), rebuild=True)
+                self._geojson_levels = self._load('geometry', self._build_geometry, rebuild=True)['region_geojson_levels']
+                for level in self.admin_levels:
+                    self._admin_features[level] = self._load(
+                        f'adm{level}', lambda level=level: self._build_admin_features(level), rebuild=True)['features']
+        self.hierarchy
+        self.facts
+        self.region_series
+        self.geojson_levels
+
+    def warm_in_background(self):
+        thread = threading.Thread(target=self.warm, name='data-warmup', daemon=True)
+        thread.start()
+        return thread
+
+    def _changed(self, name):
+        """True when a loaded entry's source files no longer match what was loaded."""
+        recorded = self._fingerprints.get(name)
+        if recorded is None:
+            return False
+        return recorded != datacache.current_fingerprint(self._sources(name), self.cache_dir / str(name))
+
+    def refresh(self):
+        """Load the years added or changed on disk since they were loaded, and drop removed ones.
+
+        Unchanged years keep their in-memory tables; only the combined table
+        and the per-region series are rebuilt, and each is replaced with one
+        assignment, so a request sees either the old or the new version. A
+        change to the regions or the finer levels reloads everything. Returns
+        ``{'years': [...], 'geometry': bool, 'hierarchy': bool}`` describing
+        what changed, or ``None`` when nothing did.
+        """
+        with self.lock:
+            years = discover_years(self.dataset_folder)
+            if not years:
+                return None
+            admin_levels = self._discover_admin_levels()
+            if (admin_levels != self.admin_levels or years[0] != self.years[0] or self._changed('hierarchy') or
+                    any(self._changed(f'adm{level}') for level in admin_levels)):
+                return self._reload_all(years)
+
+            changed = sorted(year for year in years if year not in self.years or self._changed(year))
+            removed = sorted(set(self.years) - set(years))
+            geometry = self._changed('geometry')
+            if not (changed or removed or geometry):
+                return None
+
+            fingerprints = dict(self._fingerprints)
+            try:
+                loaded = {year: parts for year, parts in self._years.items() if year in years and year not in changed}
+                for year in changed:
+                    loaded[year] = self._load(year, lambda year=year: self._build_year(year))
+                facts = region_series = None
+                if self._facts is not None:
+                    facts = concat_facts([loaded[year]['facts'] for year in years])
+                    region_series = build_region_series(facts)
+                geojson_levels = self._geojson_levels
+                if geometry and geojson_levels is not None:
+                    geojson_levels = self._load('geometry', self._build_geometry)['region_geojson_levels']
+            except Exception:
+                # Try again next time from the same starting point
+                self._fingerprints = fingerprints
+                raise
+
+            self._years = loaded
+            self._facts = facts
+            self._region_series = region_series
+            self._geojson_levels = geojson_levels
+            self.years = years
+            for year in removed:
+                self._fingerprints.pop(year, None)
+            return {'years': sorted(changed + removed), 'geometry': geometry, 'hierarchy': False}
+
+    def _reload_all(self, years):
+        fresh = DataRegistry(self.dataset_folder, years, self.cache_dir)
+        fresh.warm()
+        changed = sorted(set(years) | set(self.years))
+        self._years = fresh._years
+        self._facts = fresh._facts
+        self._region_series = fresh._region_series
+        self._hierarchy = fresh._hierarchy
+        self._geojson_levels = fresh._geojson_levels
+        self._admin_features = fresh._admin_features
+        self._fingerprints = fresh._fingerprints
+        self.admin_levels = fresh.admin_levels
+        self.years = years
+        return {'years': changed, 'geometry': True, 'hierarchy': True}
+
+    def watch(self, interval, on_change=None):
+        """Call ``refresh`` every ``interval`` seconds in a daemon thread, then ``on_change(changes)``.
+
+        A file that cannot be read yet (still being copied, say) leaves the
+        loaded data in place until the next attempt.
+        """
+        def poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    changes = self.refresh()
+                except Exception:
+                    logger.exception('Reloading the dataset from %s failed', self.dataset_folder)
+                    continue
+                if changes is not None:
+                    logger.info('Reloaded years %s from %s', changes['years'], self.dataset_folder)
+                    if on_change is not None:
+                        on_change(changes)
+
+        thread = threading.Thread(target=poll, name='data-watch', daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the binary cache of the dashboard dataset.')
+    parser.add_argument('--dataset-folder', type=Path, default=DATASET_FOLDER)
+    parser.add_argument('--cache-dir', type=Path, default=datacache.DEFAULT_CACHE_DIR)
+    parser.add_argument('--force', action='store_true', help='rebuild even if the sources are unchanged')
+    args = parser.parse_args()
+
+    registry = DataRegistry(args.dataset_folder, cache_dir=args.cache_dir)
+    registry.warm(rebuild=args.force)
+    print(f'Dataset cache in {args.cache_dir} is up to date ({registry.fingerprint[:12]})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""Binary on-disk cache of the cleaned dataset.
+
+Tables are written as uncompressed Feather (Arrow IPC) files, which the next
+start reads back with a plain copy instead of parsing them again, and byte
+payloads such as the encoded GeoJSON are written as-is. A manifest records
+the size, mtime and SHA-256 of every source file; the cache is rebuilt only
+when a source's contents change.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # without pyarrow the sources are parsed on every start
+    pa = feather = None
+
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = Path(os.environ.get('DASHBOARD_CACHE_DIR', '.cache/dataset'))
+
+
+def file_state(path):
+    stat = Path(path).stat()
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def describe_sources(sources):
+    """Manifest entries for ``sources``: size, mtime and content hash of each file."""
+    return {str(path): {**file_state(path), 'sha256': file_hash(path)} for path in sources}
+
+
+def fingerprint(described):
+    """One hash standing for the contents of every source file."""
+    digest = hashlib.sha256()
+    for path in sorted(described):
+        digest.update(f"{path}:{described[path]['sha256']}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def sources_unchanged(recorded, sources):
+    """True when every source still matches ``recorded``.
+
+    Only files whose size or mtime moved are re-hashed, so an unchanged tree
+    costs one ``stat`` per file.
+    """
+    if set(recorded) != {str(path) for path in sources}:
+        return False
+
+    for path in sources:
+        entry = recorded[str(path)]
+        state = file_state(path)
+        if state == {'size': entry['size'], 'mtime_ns': entry['mtime_ns']}:
+            continue
+        if file_hash(path) != entry['sha256']:
+            return False
+        entry.update(state)  # touched but identical
+    return True
+
+
+def read_manifest(cache_dir):
+    try:
+        with open(Path(cache_dir) / 'manifest.json') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != CACHE_VERSION:
+        return None
+    return manifest
+
+
+def current_fingerprint(sources, cache_dir):
+    """Fingerprint of ``sources`` without loading anything; taken from the manifest when it is current."""
+    sources = [Path(path) for path in sources]
+    manifest = read_manifest(cache_dir)
+    if manifest is not None and sources_unchanged(manifest['sources'], sources):
+        return manifest['fingerprint']
+    return fingerprint(describe_sources(sources))
+
+
+def _replace(path, data):
+    tmp = path.with_name(f'{path.name}.tmp-{os.getpid()}')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def write_parts(cache_dir, parts, described):
+    """Write ``parts`` (tables, byte strings or lists of byte strings) and then the manifest."""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    entries = {}
+    for name, value in parts.items():
+        if isinstance(value, bytes):
+            _replace(cache_dir / f'{name}.bin', value)
+            entries[name] = {'kind': 'blob'}
+        elif isinstance(value, list):
+            for index, blob in enumerate(value):
+                _replace(cache_dir / f'{name}-{index}.bin', blob)
+            entries[name] = {'kind': 'blobs', 'count': len(value)}
+        else:
+            path = cache_dir / f'{name}.arrow'
+            tmp = path.with_name(f'{path.name}.tmp-{os.getpid()}')
+            feather.write_feather(value.reset_index(), tmp, compression='uncompressed')
+            os.replace(tmp, path)
+            entries[name] = {'kind': 'table', 'index': list(value.index.names)}
+
+    manifest = {
+        'version': CACHE_VERSION,
+        'fingerprint': fingerprint(described),
+        'sources': described,
+        'parts': entries,
+    }
+    _replace(cache_dir / 'manifest.json', json.dumps(manifest, indent=1).encode('utf-8'))
+    return manifest
+
+
+def read_parts(cache_dir, manifest):
+    """Load every part listed in ``manifest``.
+
+    Tables are read into ordinary numpy-backed DataFrames: the callbacks and
+    the per-year concatenation need numpy columns anyway, so mapping the file
+    would only add a copy later.
+    """
+    cache_dir = Path(cache_dir)
+    parts = {}
+    for name, entry in manifest['parts'].items():
+        if entry['kind'] == 'blob':
+            parts[name] = (cache_dir / f'{name}.bin').read_bytes()
+        elif entry['kind'] == 'blobs':
+            parts[name] = [(cache_dir / f'{name}-{index}.bin').read_bytes()
+                           for index in range(entry['count'])]
+        else:
+            table = feather.read_table(cache_dir / f'{name}.arrow')
+            parts[name] = table.to_pandas().set_index(entry['index'])
+    return parts
+
+
+def load(sources, build, cache_dir=DEFAULT_CACHE_DIR, rebuild=False):
+    """Return ``(parts, fingerprint)``, from the cache when ``sources`` are unchanged.
+
+    ``build()`` is only called when the cache is missing, stale or unreadable;
+    its result is written back before being returned.
+    """
+    sources = [Path(path) for path in sources]
+
+    if feather is None:
+        return build(), fingerprint(describe_sources(sources))
+
+    manifest = None if rebuild else read_manifest(cache_dir)
+    if manifest is not None:
+        recorded = json.dumps(manifest['sources'])
+        if sources_unchanged(manifest['sources'], sources):
+            try:
+                parts = read_parts(cache_dir, manifest)
+            except (OSError, KeyError, pa.ArrowInvalid):
+                parts = None
+            if parts is not None:
+                if json.dumps(manifest['sources']) != recorded:
+                    _replace(Path(cache_dir) / 'manifest.json', json.dumps(manifest, indent=1).encode('utf-8'))
+                return parts, manifest['fingerprint']
+
+    described = describe_sources(sources)
+    parts = build()
+    manifest = write_parts(cache_dir, parts, described)
+    return parts, manifest['fingerprint']
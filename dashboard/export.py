@@ -0,0 +1,214 @@
+"""Bulk export of the figures behind the key cards and charts.
+
+``/export/{table}.{format}`` streams one of ``TABLES`` as CSV (``csv``), JSON
+Lines (``jsonl``) or an Arrow IPC stream (``arrow``, needs pyarrow):
+
+    /export/key-cards.csv?year=2021,2022
+    /export/series.jsonl?region=NCR&region=CAR
+    /export/treatment.arrow
+
+``year`` takes a comma separated list and ``region`` any node of the
+hierarchy; both can be repeated, and without them every row is exported.
+
+Rows are read straight from the column arrays of ``DataRegistry.facts``
+``CHUNK_ROWS`` at a time, and each chunk is encoded and sent before the next
+one is read, so a large pull holds one chunk in memory rather than a copy
+of the table.
+"""
+import csv
+import io
+import json
+
+import numpy as np
+from flask import Response, request
+
+from dashboard.data import FACILITY_COLUMNS, WASTE_TYPE_COLUMNS
+
+try:
+    import pyarrow as pa
+except ImportError:  # CSV and JSON Lines only
+    pa = None
+
+CHUNK_ROWS = 4096
+
+
+def key_cards(values, rows):
+    # NaN facility counts are skipped, as on the card
+    facilities = np.zeros(len(rows))
+    for column in FACILITY_COLUMNS:
+        facilities += np.nan_to_num(values[column][rows])
+    return {
+        'Total Hazardous Wastes': values['Total Hazardous Wastes'][rows],
+        'Waste Disposal Facilities': facilities,
+        'Population': values['Population'][rows],
+    }
+
+
+def series(values, rows):
+    return {column: values[column][rows]
+            for column in ['Total Hazardous Wastes', 'Total Treated Hazardous Wastes']}
+
+
+def waste_types(values, rows):
+    return {column: values[column][rows] for column in WASTE_TYPE_COLUMNS}
+
+
+def treatment(values, rows):
+    treated = values['Total Treated Hazardous Wastes'][rows]
+    generated = values['Total Hazardous Wastes'][rows]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(generated > 0, treated / generated, np.nan)
+    return {
+        'Total Treated Hazardous Wastes': treated,
+        'Total Hazardous Wastes': generated,
+        'Treated Ratio': ratio,
+    }
+
+
+# name: (the columns at some row positions, whether rows go by region then year)
+TABLES = {
+    'key-cards': (key_cards, False),
+    'series': (series, True),
+    'waste-types': (waste_types, False),
+    'treatment': (treatment, True),
+}
+
+
+class ExportError(ValueError):
+    """A filter that names a year or region the dataset does not have."""
+
+
+def select_rows(facts, years=None, regions=None, by_region=False):
+    """Positions of the ``facts`` rows matching the filters, by (Year, Region) or (Region, Year)."""
+    year_values = facts.index.get_level_values('Year').to_numpy()
+    region_codes = facts.index.codes[1]
+
+    mask = np.ones(len(facts), dtype=bool)
+    if years:
+        missing = set(years) - set(facts.index.levels[0])
+        if missing:
+            raise ExportError(f'No data for year {min(missing)}')
+        mask &= np.isin(year_values, years)
+    if regions:
+        categories = facts.index.levels[1]
+        missing = [region for region in regions if region not in categories]
+        if missing:
+            raise ExportError(f'No region named {missing[0]!r}')
+        mask &= np.isin(region_codes, categories.get_indexer(regions))
+
+    rows = np.flatnonzero(mask)
+    if by_region:
+        rows = rows[np.lexsort((year_values[rows], region_codes[rows]))]
+    return rows
+
+
+def iter_chunks(facts, table, rows, chunk_rows=CHUNK_ROWS):
+    """``(Year, Region, *table columns)`` for ``CHUNK_ROWS`` rows at a time, as plain arrays."""
+    build, _ = TABLES[table]
+    # Whole-column views of the table; only the chunk's positions are copied
+    values = {column: facts[column].to_numpy() for column in facts.columns}
+    year_values = facts.index.get_level_values('Year').to_numpy()
+    region_codes = facts.index.codes[1]
+    region_names = np.asarray(facts.index.levels[1].astype(str), dtype=object)
+
+    # An empty selection still yields one (empty) chunk, for the header
+    for start in range(0, max(len(rows), 1), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        yield {'Year': year_values[chunk], 'Region': region_names[region_codes[chunk]], **build(values, chunk)}
+
+
+def plain_values(array):
+    """The array as a list of Python values, with NaN as None."""
+    values = array.tolist()
+    if array.dtype.kind == 'f':
+        for position in np.flatnonzero(np.isnan(array)).tolist():
+            values[position] = None
+    return values
+
+
+def encode_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    header = True
+    for chunk in chunks:
+        if header:
+            writer.writerow(chunk)
+            header = False
+        writer.writerows(zip(*(plain_values(array) for array in chunk.values())))
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def encode_jsonl(chunks):
+    for chunk in chunks:
+        names = list(chunk)
+        lines = [json.dumps(dict(zip(names, row))) for row in
+                 zip(*(plain_values(array) for array in chunk.values()))]
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def encode_arrow(chunks):
+    sink = io.BytesIO()
+    writer = None
+    for chunk in chunks:
+        # Region names are the only object column
+        batch = pa.RecordBatch.from_pydict({
+            name: pa.array(array, type=pa.string()) if array.dtype == object else pa.array(array, from_pandas=True)
+            for name, array in chunk.items()})
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, batch.schema)
+        writer.write_batch(batch)
+        yield drain(sink)
+    writer.close()
+    yield drain(sink)
+
+
+def drain(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+# format: (encoder, mimetype)
+FORMATS = {
+    'csv': (encode_csv, 'text/csv'),
+    'jsonl': (encode_jsonl, 'application/x-ndjson'),
+    'arrow': (encode_arrow, 'application/vnd.apache.arrow.stream'),
+}
+
+
+def parse_years(values):
+    """``?year=`` values, each one year or a comma separated list."""
+    try:
+        return [int(year) for value in values for year in value.split(',') if year]
+    except ValueError:
+        raise ExportError('year must be a whole number') from None
+
+
+def install(server, registry, path='/export'):
+    """Serve ``path/{table}.{format}`` from ``registry``'s fact table."""
+    @server.route(f'{path}/<table>.<fmt>')
+    def export_table(table, fmt):
+        if table not in TABLES or fmt not in FORMATS:
+            return Response(status=404)
+        if fmt == 'arrow' and pa is None:
+            return Response('Arrow export needs pyarrow\n', status=501, mimetype='text/plain')
+
+        # One table for the whole response, even if a reload swaps it meanwhile
+        facts = registry.facts
+        try:
+            rows = select_rows(facts, parse_years(request.args.getlist('year')),
+                               request.args.getlist('region'), by_region=TABLES[table][1])
+        except ExportError as error:
+            return Response(f'{error}\n', status=400, mimetype='text/plain')
+
+        encode, mimetype = FORMATS[fmt]
+        response = Response(encode(iter_chunks(facts, table, rows)), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename={table}.{fmt}'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    return server
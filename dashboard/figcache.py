@@ -0,0 +1,217 @@
+"""Memoization of callback outputs.
+
+The callbacks only ever see a few hundred distinct inputs (8 years, 18
+regions, 3 map metrics), so their serialized outputs are kept in a bounded
+in-memory LRU. An optional SQLite file shares entries between worker
+processes, and a directory written by ``python -m dashboard.prerender`` can
+answer every lookup without building a figure at all. Keys carry the
+version of the data a figure was built from, so a changed or reloaded
+dataset never serves an older figure, whether from this process, another
+worker sharing the SQLite file that has not reloaded yet, or a prerender.
+"""
+import functools
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from plotly.utils import PlotlyJSONEncoder
+
+DEFAULT_MAX_BYTES = int(float(os.environ.get('DASHBOARD_FIGURE_CACHE_MB', '64')) * 1024 * 1024)
+DEFAULT_DB_PATH = os.environ.get('DASHBOARD_FIGURE_CACHE_DB')
+DEFAULT_PRERENDERED_DIR = os.environ.get('DASHBOARD_PRERENDERED')
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(name, args, version=None):
+    return json.dumps([name, list(args), version])
+
+
+def encode(result):
+    return json.dumps(result, cls=PlotlyJSONEncoder)
+
+
+class SQLiteStore:
+    """Figure JSON shared by every process that opens the same file."""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            columns = [row[1] for row in db.execute('PRAGMA table_info(figures)')]
+            if 'namespace' in columns:
+                # Written before keys carried the data version
+                db.execute('DROP TABLE figures')
+            db.execute('CREATE TABLE IF NOT EXISTS figures (key TEXT PRIMARY KEY, value TEXT)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        with self._connect() as db:
+            row = db.execute('SELECT value FROM figures WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        with self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO figures VALUES (?, ?)', (key, value))
+
+    def keys(self):
+        with self._connect() as db:
+            return [key for key, in db.execute('SELECT key FROM figures')]
+
+    def delete(self, keys):
+        with self._connect() as db:
+            db.executemany('DELETE FROM figures WHERE key = ?', [(key,) for key in keys])
+
+
+class PrerenderedStore:
+    """Read-only directory of gzip-compressed figure JSON, one file per cache key.
+
+    Only the figures whose data has not changed since the prerender are
+    found; the others have a new version in their key.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        if not (self.path / 'manifest.json').exists():
+            logger.warning('No prerendered figures in %s; run python -m dashboard.prerender', self.path)
+
+    @staticmethod
+    def filename(key):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json.gz'
+
+    def get(self, key):
+        try:
+            blob = (self.path / self.filename(key)).read_bytes()
+        except OSError:
+            return None
+        return gzip.decompress(blob).decode('utf-8')
+
+    def set(self, key, value):
+        pass
+
+    def keys(self):
+        return []
+
+    def delete(self, keys):
+        pass
+
+
+class FigureCache:
+    """Bounded LRU of serialized callback outputs, optionally backed by a shared store."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, store=None):
+        self.max_bytes = max_bytes
+        self.store = store
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        value = self.store.get(key) if self.store is not None else None
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        self._remember(key, value)
+        if self.store is not None:
+            self.store.set(key, value)
+
+    def _remember(self, key, value):
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            if len(value) > self.max_bytes:
+                return
+            self.entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def invalidate(self, predicate=None):
+        """Drop the entries whose ``(callback name, args, version)`` match ``predicate``, or all of them."""
+        def matches(key):
+            return predicate is None or predicate(*json.loads(key))
+
+        with self.lock:
+            for key in [key for key in self.entries if matches(key)]:
+                self.size -= len(self.entries.pop(key))
+        if self.store is not None:
+            self.store.delete([key for key in self.store.keys() if matches(key)])
+
+
+def create_figure_cache(max_bytes=DEFAULT_MAX_BYTES, db_path=DEFAULT_DB_PATH,
+                        prerendered_dir=DEFAULT_PRERENDERED_DIR):
+    """The cache configured from ``DASHBOARD_FIGURE_CACHE_MB``, ``DASHBOARD_FIGURE_CACHE_DB``
+    and ``DASHBOARD_PRERENDERED``; prerendered figures take precedence over SQLite."""
+    if prerendered_dir:
+        store = PrerenderedStore(prerendered_dir)
+    elif db_path:
+        store = SQLiteStore(db_path)
+    else:
+        store = None
+    return FigureCache(max_bytes=max_bytes, store=store)
+
+
+def memoize(cache, version=None):
+    """Cache a function's JSON-encoded result in ``cache``, keyed on its name and arguments.
+
+    ``version(*args)``, if given, names the data the result is built from
+    (a fingerprint, say) and is part of the key. A result is not stored when
+    the version changed while it was being built.
+
+    The wrapper also has ``key(*args)``, ``lookup(*args)``, which only reads
+    the cache (``None`` on a miss), ``compute(*args)``, which always calls
+    the function and stores its result, and ``version``.
+    """
+    def decorator(func):
+        def key(*args):
+            return cache_key(func.__name__, args, version(*args) if version is not None else None)
+
+        def lookup(*args):
+            cached = cache.get(key(*args))
+            return json.loads(cached) if cached is not None else None
+
+        def compute(*args):
+            before = key(*args)
+            value = encode(func(*args))
+            if key(*args) == before:
+                cache.set(before, value)
+            # Callers always get plain JSON data, whether or not it was cached
+            return json.loads(value)
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            cached = lookup(*args)
+            if cached is not None:
+                return cached
+            return compute(*args)
+
+        wrapper.key = key
+        wrapper.lookup = lookup
+        wrapper.compute = compute
+        wrapper.version = version
+        return wrapper
+    return decorator
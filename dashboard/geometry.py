@@ -0,0 +1,161 @@
+"""Region polygons for the choropleth.
+
+Every ``datasets/geojson/{year}_gdf.geojson`` file carries the same ADM1
+polygons; only the attribute columns change from year to year. The polygons
+are read once into a geometry store keyed by ``ADM1_PCODE`` and the yearly
+columns are read without geometry into a compact attribute table that joins
+to it on the same key.
+
+Provinces and municipalities (``geojson/adm{level}.geojson``) are kept as
+one encoded GeoJSON feature per node and level of detail, so a drilled-down
+map is served by concatenating the features of one parent's children.
+
+geopandas and shapely are imported inside the functions that need them, so
+the app only pays for them when the dataset cache is rebuilt.
+"""
+import json
+import math
+
+import pandas as pd
+
+from dashboard.data import FACILITY_COLUMNS
+
+GEOMETRY_KEY = 'ADM1_PCODE'
+
+# Columns the choropleth colours by or shows on hover
+ATTRIBUTE_COLUMNS = [
+    'Region',
+    'Illegal Dumpsites',
+    'Materials Recovery Facility',
+    'Sanitary Landfill',
+    'Registered TSD Facilities',
+    'Total Hazardous Wastes',
+    'Total Treated Hazardous Wastes',
+    'Population',
+    'Total Disposal Facilities',
+    'Hazardous Waste Per Capita',
+]
+
+
+def load_geometry(path):
+    """Read the region polygons once, indexed by ``ADM1_PCODE``."""
+    import geopandas as gpd
+
+    gdf = gpd.read_file(path, columns=[GEOMETRY_KEY, 'ADM1_EN'])
+    return gdf.set_index(GEOMETRY_KEY)
+
+
+def load_attributes(paths_by_year):
+    """Read the yearly map columns (no polygons) into one table indexed by (Year, ADM1_PCODE)."""
+    import geopandas as gpd
+
+    frames = []
+    for year, path in paths_by_year.items():
+        df = gpd.read_file(path, columns=[GEOMETRY_KEY] + ATTRIBUTE_COLUMNS, ignore_geometry=True)
+        df['Year'] = year
+        frames.append(df)
+
+    attributes = pd.concat(frames, ignore_index=True)
+    return attributes.set_index(['Year', GEOMETRY_KEY])[ATTRIBUTE_COLUMNS]
+
+
+def attributes_from_facts(facts):
+    """Map columns computed from fact rows indexed by node name, for levels without yearly GeoJSON."""
+    attributes = facts.copy()
+    attributes['Region'] = facts.index.astype(str)
+    attributes['Total Disposal Facilities'] = facts[FACILITY_COLUMNS].sum(axis=1, min_count=1)
+    attributes['Hazardous Waste Per Capita'] = facts['Total Hazardous Wastes'] / facts['Population']
+    return attributes[ATTRIBUTE_COLUMNS]
+
+
+# Levels of detail, coarsest first:
+# (minimum map zoom, simplification tolerance in degrees, smallest island kept in square degrees)
+DETAIL_LEVELS = [
+    (0, 0.02, 1e-3),
+    (6, 0.005, 1e-4),
+    (8, 0.0, 0.0),
+]
+
+
+def simplify_geometry(geometry, tolerance, min_area):
+    """Simplify the regions as one coverage so neighbouring regions keep sharing their borders.
+
+    Islands smaller than ``min_area`` are dropped afterwards; removing a whole
+    part never moves a shared edge.
+    """
+    import geopandas as gpd
+    import numpy as np
+    import shapely
+
+    if tolerance == 0 and min_area == 0:
+        return geometry
+
+    simplified = shapely.coverage_simplify(geometry.geometry.values, tolerance)
+
+    kept = []
+    for geom in simplified:
+        parts = shapely.get_parts(geom)
+        areas = shapely.area(parts)
+        # Small units (municipalities) keep at least their largest part
+        kept.append(shapely.multipolygons(parts[(areas >= min_area) | (areas == areas.max())]))
+
+    # Shared vertices round to the same point, so borders stay shared
+    kept = shapely.transform(np.array(kept), lambda coords: np.round(coords, 4))
+    return geometry.set_geometry(gpd.GeoSeries(kept, index=geometry.index, crs=geometry.crs))
+
+
+def build_detail_levels(geometry):
+    """Encode one GeoJSON payload per entry of ``DETAIL_LEVELS``."""
+    return [encode_geojson(simplify_geometry(geometry, tolerance, min_area))
+            for _, tolerance, min_area in DETAIL_LEVELS]
+
+
+def detail_level_for_zoom(zoom):
+    """Index of the coarsest level that still looks right at ``zoom``."""
+    level = 0
+    for index, (min_zoom, _, _) in enumerate(DETAIL_LEVELS):
+        if zoom >= min_zoom:
+            level = index
+    return level
+
+
+def encode_geojson(geometry):
+    """Serialize the polygons to GeoJSON bytes once; feature ids are the ``ADM1_PCODE`` keys."""
+    return geometry.geometry.to_json().encode('utf-8')
+
+
+def load_admin_geometry(path):
+    """Read a province or municipality level, indexed by node name."""
+    import geopandas as gpd
+
+    gdf = gpd.read_file(path, columns=['Region', 'Parent'])
+    return gdf.set_index('Region')
+
+
+def build_feature_table(geometry):
+    """One row per node: its bounds and an encoded feature per level of detail.
+
+    Feature ids are the node names, which the fact table is indexed by.
+    """
+    import shapely
+
+    table = geometry.geometry.bounds
+    for level, (_, tolerance, min_area) in enumerate(DETAIL_LEVELS):
+        simplified = simplify_geometry(geometry, tolerance, min_area)
+        table[f'feature_{level}'] = [
+            f'{{"type": "Feature", "id": {json.dumps(name)}, "properties": {{}}, "geometry": {shapely.to_geojson(geom)}}}'
+            for name, geom in zip(simplified.index, simplified.geometry.values)
+        ]
+    return table
+
+
+def feature_collection(features):
+    """GeoJSON bytes of the already encoded ``features``."""
+    return ('{"type": "FeatureCollection", "features": [' + ', '.join(features) + ']}').encode('utf-8')
+
+
+def view_for_bounds(minx, miny, maxx, maxy):
+    """Map centre and zoom that fit the bounds (in degrees) into the choropleth."""
+    center = {'lat': (miny + maxy) / 2, 'lon': (minx + maxx) / 2}
+    zoom = math.log2(360 / max(maxx - minx, maxy - miny, 1e-3)) - 1
+    return center, min(zoom, 12)
@@ -0,0 +1,102 @@
+"""Administrative hierarchy: the country, its regions and optional finer levels.
+
+Level 0 is the national row ("Philippines") that every cleaned CSV starts
+with and level 1 the regions after it. Provinces (level 2) and
+cities/municipalities (level 3) are optional: they exist when the dataset has
+``geojson/adm{level}.geojson``, whose features carry a ``Region`` name (unique
+across the whole hierarchy) and the ``Parent`` it belongs to. Their yearly
+figures are read from ``waste_data/adm{level}/{year}.csv`` where present;
+levels without a file are summed bottom-up from the level below when the
+year is loaded, so every node of every level is one row of the fact table.
+"""
+import pandas as pd
+
+ADMIN_LEVELS = [2, 3]
+
+
+def build_nodes(national_csv, admin_geojson_paths):
+    """Every node in display order, indexed by name, with its ``Parent`` and ``Level``.
+
+    ``national_csv`` is a cleaned yearly CSV (the national row, then the
+    regions); ``admin_geojson_paths`` maps each finer level to its GeoJSON.
+    """
+    import geopandas as gpd
+
+    names = pd.read_csv(national_csv, usecols=['Region'])['Region'].drop_duplicates().tolist()
+    frames = [pd.DataFrame({'Region': names[:1], 'Parent': [None], 'Level': 0}),
+              pd.DataFrame({'Region': names[1:], 'Parent': names[0], 'Level': 1})]
+    for level, path in admin_geojson_paths.items():
+        df = gpd.read_file(path, columns=['Region', 'Parent'], ignore_geometry=True)
+        df['Level'] = level
+        frames.append(df)
+
+    nodes = pd.concat(frames, ignore_index=True)
+    nodes['Level'] = nodes['Level'].astype('int8')
+    return nodes.set_index('Region')
+
+
+def roll_up(facts, parents):
+    """Sum the rows of ``facts`` (indexed by node name) into one row per parent, in first-seen order."""
+    grouped = facts.groupby(parents.loc[facts.index].values, sort=False).sum(min_count=1)
+    return grouped.rename_axis(facts.index.name)
+
+
+class Hierarchy:
+    """Parent/child lookups over the node table of ``build_nodes``."""
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.names = nodes.index.tolist()
+        self.root = self.names[0]
+        self.depth = int(nodes['Level'].max())
+        self._position = {name: position for position, name in enumerate(self.names)}
+        self._parent = {name: None if pd.isna(parent) else parent for name, parent in nodes['Parent'].items()}
+        self._children = {name: [] for name in self.names}
+        for name, parent in self._parent.items():
+            if parent is not None:
+                self._children[parent].append(name)
+
+    def __contains__(self, name):
+        return name in self._position
+
+    def position(self, name):
+        """A node's index in display order; stable for one dataset fingerprint."""
+        return self._position[name]
+
+    def level(self, name):
+        return int(self.nodes.at[name, 'Level'])
+
+    def parent(self, name):
+        return self._parent[name]
+
+    def children(self, name):
+        return self._children[name]
+
+    def ancestors(self, name):
+        """The path from the root down to ``name``'s parent."""
+        path = []
+        while (name := self.parent(name)) is not None:
+            path.append(name)
+        return path[::-1]
+
+    def level_names(self, level):
+        return self.nodes.index[self.nodes['Level'] == level].tolist()
+
+    def map_node(self, name):
+        """The node whose children the map shows for ``name``: itself, or its parent for a leaf."""
+        return name if self.children(name) else self.parent(name)
+
+    def options(self, name):
+        """Dropdown options to drill from ``name``: its ancestors, itself or its siblings, and its children.
+
+        Regions are listed flush; provinces and municipalities are indented
+        under them.
+        """
+        shown = self.ancestors(name)
+        shown += self.children(shown[-1]) if shown else [name]
+        if self.children(name):
+            at = shown.index(name) + 1
+            shown[at:at] = self.children(name)
+
+        return [{'label': '\u2003' * max(self.level(node) - 1, 0) + node, 'value': node}
+                for node in shown]
@@ -0,0 +1,104 @@
+"""Compression and conditional caching for the dashboard's HTTP responses.
+
+Large JSON/GeoJSON/text responses are gzip (or brotli, when installed)
+compressed. Responses that carry an ETag (the map outlines) answer a
+matching ``If-None-Match`` with a 304, and their compressed bytes are kept
+by ETag so they are not compressed again. Callback responses get no ETag:
+Dash sends them as ``fetch`` POSTs, which browsers never revalidate, so they
+are just compressed. Assets carry long-lived ``Cache-Control`` headers when
+Dash has fingerprinted their URL.
+"""
+import gzip
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_TYPES = ('application/json', 'application/geo+json', 'application/javascript', 'text/')
+
+# Dash appends ?m=<mtime> to asset URLs, so those can be cached for good
+FINGERPRINTED_ASSET_CACHE = 'public, max-age=31536000, immutable'
+ASSET_CACHE = 'public, max-age=3600'
+GEOMETRY_CACHE = 'public, max-age=86400'
+CALLBACK_CACHE = 'private, no-cache'
+
+
+class CompressedBlobs:
+    """Bounded LRU of compressed response bodies keyed by ``(etag, encoding)``."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, etag, encoding, data):
+        key = (etag, encoding)
+        with self.lock:
+            blob = self.entries.get(key)
+            if blob is not None:
+                self.entries.move_to_end(key)
+                return blob
+
+        blob = compress(data, encoding)
+        with self.lock:
+            self.entries[key] = blob
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return blob
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def choose_encoding(accept_encoding):
+    if brotli is not None and 'br' in accept_encoding:
+        return 'br'
+    if 'gzip' in accept_encoding:
+        return 'gzip'
+    return None
+
+
+def install(server, max_blobs=512):
+    """Add ETag, Cache-Control and compression handling to every response of ``server``."""
+    blobs = CompressedBlobs(max_blobs)
+
+    @server.after_request
+    def cache_and_compress(response):
+        if request.path.startswith('/assets/'):
+            response.headers['Cache-Control'] = FINGERPRINTED_ASSET_CACHE if 'm' in request.args else ASSET_CACHE
+        # Streamed bodies (exports) are sent as they are produced, never buffered here
+        if response.status_code != 200 or response.direct_passthrough or response.is_streamed:
+            return response
+
+        if request.method == 'POST' and request.path.endswith('_dash-update-component'):
+            response.headers.setdefault('Cache-Control', CALLBACK_CACHE)
+        etag, _ = response.get_etag()
+        if etag and request.if_none_match.contains(etag):
+            return Response(status=304, headers={header: response.headers[header]
+                                                 for header in ('ETag', 'Cache-Control') if header in response.headers})
+
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+        if (encoding is None or 'Content-Encoding' in response.headers
+                or not response.mimetype.startswith(COMPRESSIBLE_TYPES)):
+            return response
+
+        data = response.get_data()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return response
+
+        body = blobs.get(etag, encoding, data) if etag else compress(data, encoding)
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
+    return server
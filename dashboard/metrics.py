@@ -0,0 +1,165 @@
+"""Per-callback latency, payload and cache instrumentation.
+
+``CallbackMetrics.instrument`` wraps a Dash callback and records its total
+latency; inside the figure builders ``metrics.lap('data')`` and
+``metrics.lap('figure')`` split that time into data preparation and figure
+building, and the time from the callback returning to the response
+being finished is recorded as the ``serialize`` phase. Response sizes and
+figure-cache hit ratios are collected alongside, and everything is exposed
+in the Prometheus text format on ``/metrics``.
+
+Metrics are kept per process; under gunicorn each worker reports its own.
+"""
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+
+from flask import Response
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+DEFAULT_SLOW_MS = os.environ.get('DASHBOARD_SLOW_CALLBACK_MS')
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class CallbackMetrics:
+    def __init__(self, caches=None, slow_ms=DEFAULT_SLOW_MS):
+        self.caches = caches or {}
+        self.slow_seconds = float(slow_ms) / 1000 if slow_ms else None
+        self.latency = {}
+        self.sizes = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def observe(self, callback, phase, seconds):
+        with self.lock:
+            histogram = self.latency.get((callback, phase))
+            if histogram is None:
+                histogram = self.latency[callback, phase] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+
+    def observe_size(self, callback, size):
+        with self.lock:
+            histogram = self.sizes.get(callback)
+            if histogram is None:
+                histogram = self.sizes[callback] = Histogram(SIZE_BUCKETS)
+            histogram.observe(size)
+
+    def lap(self, name):
+        """Attribute the time since the last lap (or the callback's start) to phase ``name``."""
+        current = getattr(self.local, 'current', None)
+        if current is None:
+            return
+        now = time.perf_counter()
+        current['phases'][name] = current['phases'].get(name, 0.0) + now - current['mark']
+        current['mark'] = now
+
+    def bind(self, func):
+        """``func``, timed as part of the calling callback when it runs on another thread.
+
+        The wait before it starts is recorded as the ``queue`` phase.
+        """
+        current = getattr(self.local, 'current', None)
+
+        @functools.wraps(func)
+        def bound(*args):
+            self.local.current = current
+            try:
+                self.lap('queue')
+                return func(*args)
+            finally:
+                self.local.current = None
+        return bound
+
+    def instrument(self, func):
+        """Record the latency of every call to the callback ``func``."""
+        @functools.wraps(func)
+        def wrapper(*args):
+            start = time.perf_counter()
+            current = self.local.current = {'name': func.__name__, 'args': args, 'phases': {}, 'mark': start}
+            try:
+                return func(*args)
+            finally:
+                finished = time.perf_counter()
+                current['finished'] = finished
+                self.observe(func.__name__, 'total', finished - start)
+                for phase, seconds in current['phases'].items():
+                    self.observe(func.__name__, phase, seconds)
+                if self.slow_seconds is not None and finished - start >= self.slow_seconds:
+                    logger.warning('Slow callback %s%r took %.1f ms (%s)', func.__name__, args,
+                                   (finished - start) * 1000,
+                                   ', '.join(f'{phase} {seconds * 1000:.1f} ms'
+                                             for phase, seconds in current['phases'].items()))
+        return wrapper
+
+    def render(self):
+        lines = ['# TYPE dashboard_callback_seconds histogram']
+        with self.lock:
+            for (callback, phase), histogram in sorted(self.latency.items()):
+                lines += histogram.render('dashboard_callback_seconds', f'callback="{callback}",phase="{phase}"')
+            lines.append('# TYPE dashboard_callback_response_bytes histogram')
+            for callback, histogram in sorted(self.sizes.items()):
+                lines += histogram.render('dashboard_callback_response_bytes', f'callback="{callback}"')
+
+        caches = sorted(self.caches.items())
+        lines.append('# TYPE dashboard_cache_hits_total counter')
+        lines += [f'dashboard_cache_hits_total{{cache="{name}"}} {cache.hits}' for name, cache in caches]
+        lines.append('# TYPE dashboard_cache_misses_total counter')
+        lines += [f'dashboard_cache_misses_total{{cache="{name}"}} {cache.misses}' for name, cache in caches]
+        lines.append('# TYPE dashboard_cache_hit_ratio gauge')
+        for name, cache in caches:
+            lookups = cache.hits + cache.misses
+            lines.append(f'dashboard_cache_hit_ratio{{cache="{name}"}} {cache.hits / lookups if lookups else 0.0}')
+        return '\n'.join(lines) + '\n'
+
+    def install(self, server, path='/metrics'):
+        """Record serialization time and response size of callbacks, and serve ``path``.
+
+        Install this before any hook that rewrites the body (compression),
+        so that it sees the bytes sent.
+        """
+        @server.after_request
+        def record_response(response):
+            current = getattr(self.local, 'current', None)
+            if current is None:
+                return response
+            self.local.current = None
+            if 'finished' in current:
+                self.observe(current['name'], 'serialize', time.perf_counter() - current['finished'])
+            if not response.direct_passthrough:
+                self.observe_size(current['name'], len(response.get_data()))
+            return response
+
+        @server.route(path)
+        def serve_metrics():
+            return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+        return server
@@ -0,0 +1,88 @@
+"""Render every callback output ahead of time.
+
+Enumerates all year x node x metric inputs of the app's memoized figure
+builders, renders
+them across a process pool and writes the figure JSON, gzip-compressed, to
+one file per input. Start the app with ``DASHBOARD_PRERENDERED=<out dir>``
+to answer callbacks from these files.
+
+    python -m dashboard.prerender --out prerendered
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from dashboard.figcache import PrerenderedStore, encode
+
+
+def callback_inputs(app):
+    """Every ``(function name, args)`` the layout can produce."""
+    years = list(app.data_years)
+    hierarchy = app.registry.hierarchy
+    metrics = [option['value'] for option in app.dropdown_options]
+    levels = range(len(app.DETAIL_LEVELS))
+    map_nodes = [name for name in hierarchy.names if hierarchy.children(name)]
+
+    for region in hierarchy.names:
+        yield 'line_figure', (region,)
+        yield 'area_figure', (region,)
+        for year in years:
+            yield 'update_metrics', (year, region)
+            yield 'pie_figure', (year, region)
+    for metric in metrics:
+        for year in years:
+            for level in levels:
+                for map_node in map_nodes:
+                    yield 'map_figure', (metric, year, level, map_node)
+
+
+def render(out_dir, name, args):
+    import app
+
+    builder = getattr(app, name)
+    key = builder.key(*args)
+    value = encode(builder(*args))
+    (Path(out_dir) / PrerenderedStore.filename(key)).write_bytes(gzip.compress(value.encode('utf-8')))
+    return key
+
+
+def prerender(out_dir, workers=None):
+    # Never read back an older prerender while writing a new one
+    os.environ.pop('DASHBOARD_PRERENDERED', None)
+    # Nothing may be loading in a background thread when the pool forks
+    # (as in dashboard.serve), or the workers wait forever on its lock
+    os.environ['DASHBOARD_BACKGROUND_WARMUP'] = '0'
+    import app
+
+    app.registry.warm()
+
+    out_dir = Path(out_dir)
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    out_dir.mkdir(parents=True)
+
+    tasks = list(callback_inputs(app))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        keys = list(pool.map(render, [out_dir] * len(tasks), *zip(*tasks), chunksize=8))
+
+    manifest = {'fingerprint': app.registry.fingerprint, 'keys': keys}
+    (out_dir / 'manifest.json').write_text(json.dumps(manifest))
+    return keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prerender every callback output of the dashboard.')
+    parser.add_argument('--out', type=Path, default=Path('prerendered'))
+    parser.add_argument('--workers', type=int, default=None, help='processes to use (default: one per core)')
+    args = parser.parse_args()
+
+    keys = prerender(args.out, args.workers)
+    print(f'Wrote {len(keys)} figures to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Production entry point.
+
+Loads the whole dataset once in the master process and then forks the
+workers, so every worker shares the master's pages copy-on-write instead of
+loading its own copy. ``gc.freeze()`` moves everything loaded so far out of
+the garbage collector's reach, so collections in the workers do not write
+to (and so un-share) those pages.
+
+    python -m dashboard.serve --workers 4 --threads 8 --bind 0.0.0.0:8050
+
+or, with any WSGI server that preloads the application:
+
+    gunicorn --preload --workers 4 --threads 8 'dashboard.serve:create_app()'
+
+(call ``app.watch_data()`` in each worker after the fork to pick up new
+yearly files without a restart).
+"""
+import argparse
+import gc
+import os
+
+
+def create_app():
+    """Import the dashboard, load all of its data and return the WSGI application."""
+    # Nothing may be loading in a background thread when the workers fork
+    os.environ['DASHBOARD_BACKGROUND_WARMUP'] = '0'
+    import app
+
+    app.registry.warm()
+    gc.collect()
+    gc.freeze()
+    return app.app.server
+
+
+def serve(bind, workers, threads):
+    server = create_app()
+    from app import watch_data
+    host, _, port = bind.rpartition(':')
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        if workers > 1:
+            raise SystemExit('Serving with more than one worker needs gunicorn (pip install gunicorn)')
+        from werkzeug.serving import run_simple
+        watch_data()
+        run_simple(host or '127.0.0.1', int(port), server, threaded=threads > 1)
+        return
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', bind)
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('preload_app', True)
+            # Threads do not survive the fork, so each worker starts its own watcher
+            self.cfg.set('post_fork', lambda arbiter, worker: watch_data())
+
+        def load(self):
+            return server
+
+    Application().run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the dashboard with preloaded data.')
+    parser.add_argument('--bind', default=os.environ.get('DASHBOARD_BIND', '127.0.0.1:8050'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('DASHBOARD_WORKERS', os.cpu_count() or 1)),
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('DASHBOARD_THREADS', '4')),
+                        help='threads per worker')
+    args = parser.parse_args()
+
+    serve(args.bind, args.workers, args.threads)
+
+
+if __name__ == '__main__':
+    main()
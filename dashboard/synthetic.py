@@ -0,0 +1,263 @@
+"""Synthetic datasets shaped like ``datasets/`` at any number of regions and years.
+
+Writes ``waste_data/new/{year}.csv`` with the columns of the real cleaned
+CSVs (a national "Philippines" row first, then one row per region) and
+``geojson/{year}_gdf.geojson`` with one polygon per region and the
+attribute columns the choropleth reads. The polygons tile the Philippines'
+bounding box as a jittered grid whose neighbours share their borders
+vertex for vertex, like the real administrative boundaries, so
+coverage simplification behaves as it does on real data.
+
+With ``--levels 2`` or ``3`` every region is also split into
+``--split`` x ``--split`` provinces, and every province into municipalities;
+their outlines go to ``geojson/adm{level}.geojson`` and only the finest
+level's figures to ``waste_data/adm{level}/{year}.csv``, so the app sums
+the levels in between itself (see ``dashboard.hierarchy``).
+
+    python -m dashboard.synthetic --regions 1600 --years 2000-2039 --out .cache/synthetic
+    python -m dashboard.synthetic --regions 17 --levels 3 --split 4 --out .cache/synthetic-adm3
+    DASHBOARD_DATASET_FOLDER=.cache/synthetic DASHBOARD_CACHE_DIR=.cache/synthetic-cache python app.py
+
+The output is a pure function of the arguments and ``--seed``.
+"""
+import argparse
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from dashboard.data import FACILITY_COLUMNS, WASTE_TYPE_COLUMNS
+from dashboard.hierarchy import roll_up
+
+NATIONAL_REGION = 'Philippines'
+
+# lon_min, lat_min, lon_max, lat_max
+BOUNDS = (116.9, 4.6, 126.6, 21.1)
+
+CSV_COLUMNS = (['index', 'Region'] + FACILITY_COLUMNS + WASTE_TYPE_COLUMNS +
+               ['Total Hazardous Wastes', 'Total Treated Hazardous Wastes', 'Year', 'Population'])
+
+
+def parse_years(text):
+    """``2015-2022`` or ``2015,2018,2020`` as a list of years."""
+    if '-' in text:
+        first, last = text.split('-')
+        return list(range(int(first), int(last) + 1))
+    return [int(year) for year in text.split(',')]
+
+
+def grid_shape(count):
+    """Columns and rows of the smallest grid with at least ``count`` cells, about as tall as the bounds."""
+    lon_min, lat_min, lon_max, lat_max = BOUNDS
+    aspect = (lat_max - lat_min) / (lon_max - lon_min)
+    columns = max(1, round(math.sqrt(count / aspect)))
+    return columns, math.ceil(count / columns)
+
+
+def build_grid(columns, rows, vertices_per_edge, rng):
+    """Edges of a jittered grid: ``horizontal[i][j]`` runs from corner (i, j) to (i + 1, j), ``vertical[i][j]`` to (i, j + 1).
+
+    Inner edges wiggle a little; the outer border stays straight.
+    """
+    lon_min, lat_min, lon_max, lat_max = BOUNDS
+    width = (lon_max - lon_min) / columns
+    height = (lat_max - lat_min) / rows
+
+    xs, ys = np.meshgrid(np.linspace(lon_min, lon_max, columns + 1),
+                         np.linspace(lat_min, lat_max, rows + 1), indexing='ij')
+    xs[1:-1, :] += rng.uniform(-0.2, 0.2, (columns - 1, rows + 1)) * width
+    ys[:, 1:-1] += rng.uniform(-0.2, 0.2, (columns + 1, rows - 1)) * height
+    corners = np.stack([xs, ys], axis=-1)
+
+    def edge(start, end, wiggle):
+        # Intermediate points along start-end, pushed sideways by a little noise
+        t = np.linspace(0, 1, vertices_per_edge + 2)[:, None]
+        points = start + t * (end - start)
+        if wiggle and vertices_per_edge:
+            normal = np.array([-(end - start)[1], (end - start)[0]])
+            normal /= np.linalg.norm(normal)
+            offsets = rng.uniform(-0.08, 0.08, vertices_per_edge) * min(width, height)
+            # Tapered towards the corners, where the edges of four cells meet
+            offsets *= np.sin(np.pi * t[1:-1, 0])
+            points[1:-1] += offsets[:, None] * normal
+        return points
+
+    horizontal = [[edge(corners[i, j], corners[i + 1, j], 0 < j < rows) for j in range(rows + 1)]
+                  for i in range(columns)]
+    vertical = [[edge(corners[i, j], corners[i, j + 1], 0 < i < columns) for j in range(rows)]
+                for i in range(columns + 1)]
+    return horizontal, vertical
+
+
+def block_ring(grid, i0, j0, size):
+    """The outline of the ``size`` x ``size`` block of cells whose lower left cell is (i0, j0)."""
+    horizontal, vertical = grid
+    i1, j1 = i0 + size, j0 + size
+    ring = ([horizontal[i][j0][:-1] for i in range(i0, i1)] +
+            [vertical[i1][j][:-1] for j in range(j0, j1)] +
+            [horizontal[i][j1][::-1][:-1] for i in reversed(range(i0, i1))] +
+            [vertical[i0][j][::-1][:-1] for j in reversed(range(j0, j1))])
+    ring = np.concatenate(ring)
+    return np.round(np.concatenate([ring, ring[:1]]), 6).tolist()
+
+
+def build_nodes(regions, levels, split):
+    """Every region, province and municipality as (level, name, parent, block of grid cells)."""
+    columns, _ = grid_shape(regions)
+    size = split ** (levels - 1)
+    nodes = []
+    for number in range(regions):
+        i, j = number % columns, number // columns
+        nodes.append((1, f'Synthetic Region {number + 1:05d}', NATIONAL_REGION, (i * size, j * size, size)))
+
+    for level in range(2, levels + 1):
+        kind = 'Province' if level == 2 else 'Municipality'
+        for _, parent, _, (i0, j0, parent_size) in [node for node in nodes if node[0] == level - 1]:
+            size = parent_size // split
+            suffix = parent.rsplit(' ', 1)[1]
+            for k in range(split * split):
+                block = (i0 + (k % split) * size, j0 + (k // split) * size, size)
+                nodes.append((level, f'{kind} {suffix}-{k + 1:02d}', parent, block))
+    return nodes
+
+
+def build_year(year, first_year, base, rng):
+    """One year of figures for every leaf node, indexed by name."""
+    growth = 1.03 ** (year - first_year)
+    count = len(base['Population'])
+
+    facts = pd.DataFrame(index=pd.Index(base['Region'], name='Region'))
+    for column in FACILITY_COLUMNS:
+        values = rng.poisson(base[column] * growth).astype('float64')
+        # The real facility counts have gaps
+        values[rng.random(count) < 0.02] = np.nan
+        facts[column] = values
+    for column in WASTE_TYPE_COLUMNS:
+        facts[column] = np.round(rng.gamma(0.6, base['waste_scale'] * growth), 2)
+    facts['Total Hazardous Wastes'] = facts[WASTE_TYPE_COLUMNS].sum(axis=1).round(2)
+    facts['Total Treated Hazardous Wastes'] = (facts['Total Hazardous Wastes'] *
+                                               rng.uniform(0.1, 0.9, count)).round(2)
+    facts['Year'] = year
+    facts['Population'] = np.round(base['Population'] * growth ** 0.5).astype('float64')
+    return facts
+
+
+def to_csv_rows(facts, year):
+    rows = facts.round(2).reset_index()
+    rows['Year'] = year
+    rows.insert(0, 'index', range(len(rows)))
+    return rows[CSV_COLUMNS]
+
+
+def geojson_features(regions, codes, rings):
+    """ADM1 features carrying the attribute columns of the real yearly GeoJSON."""
+    regions = regions.reset_index()
+    disposal = regions[FACILITY_COLUMNS].sum(axis=1, min_count=1)
+    per_capita = regions['Total Hazardous Wastes'] / regions['Population']
+
+    features = []
+    for row, (code, ring) in enumerate(zip(codes, rings)):
+        properties = {
+            'ADM1_EN': regions.at[row, 'Region'],
+            'ADM1_PCODE': code,
+            **{column: regions.at[row, column] for column in ['Region'] + FACILITY_COLUMNS +
+               ['Total Hazardous Wastes', 'Total Treated Hazardous Wastes', 'Year', 'Population']},
+            'Total Disposal Facilities': disposal[row],
+            'Hazardous Waste Per Capita': per_capita[row],
+        }
+        features.append({
+            'type': 'Feature',
+            'properties': {key: json_value(value) for key, value in properties.items()},
+            'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+        })
+    return features
+
+
+def json_value(value):
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def write_geojson(path, features):
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': features}))
+
+
+def generate(out_dir, regions=17, years=range(2015, 2023), levels=1, split=3, vertices_per_edge=8, seed=0):
+    """Write a synthetic dataset of ``regions`` regions (split ``levels`` deep) and ``years`` years under ``out_dir``."""
+    out_dir = Path(out_dir)
+    years = list(years)
+    rng = np.random.default_rng(seed)
+
+    nodes = build_nodes(regions, levels, split)
+    columns, rows = grid_shape(regions)
+    size = split ** (levels - 1)
+    grid = build_grid(columns * size, rows * size, vertices_per_edge, rng)
+    parents = pd.Series({name: parent for _, name, parent, _ in nodes})
+
+    # Per-leaf scales, so each leaf's history is consistent across years
+    leaves = [name for level, name, _, _ in nodes if level == levels]
+    population = rng.lognormal(math.log(100e6 / len(leaves)), 0.8, len(leaves))
+    base = {
+        'Region': leaves,
+        'Population': population,
+        'waste_scale': population * 0.07 / len(WASTE_TYPE_COLUMNS),
+        **{column: population * rate for column, rate in zip(
+            FACILITY_COLUMNS, [5e-6, 9e-5, 1e-6, 1.2e-6])},
+    }
+
+    csv_dir = out_dir / 'waste_data' / 'new'
+    geojson_dir = out_dir / 'geojson'
+    csv_dir.mkdir(parents=True, exist_ok=True)
+    geojson_dir.mkdir(parents=True, exist_ok=True)
+
+    region_nodes = [node for node in nodes if node[0] == 1]
+    codes = [f'SY{number:05d}' for number in range(1, len(region_nodes) + 1)]
+    region_rings = [block_ring(grid, *block) for _, _, _, block in region_nodes]
+
+    for level in range(2, levels + 1):
+        features = [{
+            'type': 'Feature',
+            'properties': {'Region': name, 'Parent': parent},
+            'geometry': {'type': 'Polygon', 'coordinates': [block_ring(grid, *block)]},
+        } for node_level, name, parent, block in nodes if node_level == level]
+        write_geojson(geojson_dir / f'adm{level}.geojson', features)
+
+    for year in years:
+        facts = build_year(year, years[0], base, rng)
+        if levels > 1:
+            leaf_dir = out_dir / 'waste_data' / f'adm{levels}'
+            leaf_dir.mkdir(parents=True, exist_ok=True)
+            to_csv_rows(facts, year).to_csv(leaf_dir / f'{year}.csv', index=False)
+            for _ in range(levels - 1):
+                facts = roll_up(facts, parents)
+
+        national = facts.sum(min_count=1).to_frame(NATIONAL_REGION).T
+        to_csv_rows(pd.concat([national, facts]).rename_axis('Region'), year).to_csv(csv_dir / f'{year}.csv', index=False)
+        write_geojson(geojson_dir / f'{year}_gdf.geojson',
+                      geojson_features(facts.round(2).assign(Year=year), codes, region_rings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic dataset shaped like datasets/.')
+    parser.add_argument('--out', type=Path, required=True, help='dataset folder to write')
+    parser.add_argument('--regions', type=int, default=17)
+    parser.add_argument('--years', type=parse_years, default=list(range(2015, 2023)),
+                        help='first-last or a comma separated list (default: 2015-2022)')
+    parser.add_argument('--levels', type=int, choices=[1, 2, 3], default=1,
+                        help='1: regions only, 2: and provinces, 3: and municipalities')
+    parser.add_argument('--split', type=int, default=3,
+                        help='each region or province is split into split x split children')
+    parser.add_argument('--vertices-per-edge', type=int, default=8,
+                        help='extra boundary points between two grid corners')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.out, args.regions, args.years, args.levels, args.split, args.vertices_per_edge, args.seed)
+    print(f'Wrote {args.regions} regions x {len(args.years)} years ({args.levels} levels) to {args.out}')
+
+
+if __name__ == '__main__':
+    main()